@@ -0,0 +1,312 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+
+# Load test for TournamentBot. Scenarios replay synthetic updates against a
+# fresh database in a temporary directory and a fake Bot API, so no network
+# or token is needed.
+#
+#   python benchmark.py --save before.json
+#   python benchmark.py --compare before.json
+#
+# Each scenario reports updates/sec, handler latency percentiles, SQL
+# statements per update and Bot API calls. Updates are dispatched through
+# the same ChatUpdateProcessor the bot runs with, so each chat's updates
+# are handled in order while different chats run concurrently.
+
+SCENARIOS = ('registration_rush', 'bracket_storm', 'result_entry')
+
+ADMIN_ID = 1
+
+class FakeBot:
+    # Stands in for telegram.Bot; every API method succeeds at once and is
+    # counted by name
+    def __init__(self):
+        self.calls = Counter()
+
+    def __getattr__(self, name):
+        async def call(*args, **kwargs):
+            self.calls[name] += 1
+            return True
+        return call
+
+class FakeUser:
+    def __init__(self, user_id, username):
+        self.id = user_id
+        self.username = username
+        self.first_name = username
+
+class FakeChat:
+    def __init__(self, chat_id):
+        self.id = chat_id
+
+class FakePhoto:
+    def __init__(self, file_id):
+        self.file_id = file_id
+        self.file_unique_id = file_id
+
+class FakeMessage:
+    sent = 0
+
+    def __init__(self, bot, user, text=None, photo=None):
+        FakeMessage.sent += 1
+        self.message_id = FakeMessage.sent
+        self.bot = bot
+        self.from_user = user
+        self.chat = FakeChat(user.id)
+        self.chat_id = user.id
+        self.text = text
+        self.photo = photo or []
+        self.media_group_id = None
+
+    async def reply_text(self, text, **kwargs):
+        await self.bot.send_message(self.chat_id, text, **kwargs)
+        return FakeMessage(self.bot, self.from_user, text)
+
+    async def reply_photo(self, photo, **kwargs):
+        return await self.bot.send_photo(self.chat_id, photo, **kwargs)
+
+    async def reply_media_group(self, media, **kwargs):
+        return await self.bot.send_media_group(self.chat_id, media, **kwargs)
+
+    async def pin(self, **kwargs):
+        return await self.bot.pin_chat_message(self.chat_id, self.message_id, **kwargs)
+
+class FakeCallbackQuery:
+    def __init__(self, bot, user, data):
+        self.bot = bot
+        self.from_user = user
+        self.data = data
+        self.message = FakeMessage(bot, user)
+
+    async def answer(self, *args, **kwargs):
+        return await self.bot.answer_callback_query(self.data, *args, **kwargs)
+
+    async def edit_message_text(self, text, **kwargs):
+        return await self.bot.edit_message_text(text, self.message.chat_id, **kwargs)
+
+class FakeUpdate:
+    def __init__(self, user, message=None, callback_query=None):
+        self.effective_user = user
+        self.effective_chat = FakeChat(user.id)
+        self.message = message
+        self.callback_query = callback_query
+
+class FakeContext:
+    def __init__(self, bot):
+        self.bot = bot
+        self.user_data = {}
+        self.chat_data = {}
+        self.bot_data = {}
+
+def percentile(values, percent):
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100)[percent - 1]
+
+class Harness:
+    def __init__(self, app, concurrency):
+        self.app = app
+        self.bot = app.TournamentBot()
+        self.fake_bot = FakeBot()
+        self.context = FakeContext(self.fake_bot)
+        self.processor = app.ChatUpdateProcessor(concurrency)
+        self.users = {}
+        self.queries = 0
+        self.tracing = False
+        app.database.conn.set_trace_callback(self.trace)
+        self.reset()
+
+    def trace(self, statement):
+        if self.tracing:
+            self.queries += 1
+
+    def reset(self):
+        self.latencies = []
+        self.elapsed = 0.0
+        self.queries = 0
+        self.fake_bot.calls.clear()
+
+    def user(self, user_id):
+        if user_id not in self.users:
+            self.users[user_id] = FakeUser(user_id, f"player{user_id}")
+        return self.users[user_id]
+
+    def button(self, user_id, name, *args):
+        user = self.user(user_id)
+        query = FakeCallbackQuery(self.fake_bot, user, self.app.callbacks.encode(name, *args))
+        return self.bot.button_handler, FakeUpdate(user, callback_query=query)
+
+    def text(self, user_id, text):
+        user = self.user(user_id)
+        return self.bot.handle_message, FakeUpdate(user, FakeMessage(self.fake_bot, user, text))
+
+    def photo(self, user_id, file_id):
+        user = self.user(user_id)
+        message = FakeMessage(self.fake_bot, user, photo=[FakePhoto(file_id)])
+        return self.bot.handle_team_photos, FakeUpdate(user, message)
+
+    async def handle(self, handler, update):
+        started = time.perf_counter()
+        await handler(update, self.context)
+        self.latencies.append(time.perf_counter() - started)
+
+    async def dispatch(self, updates):
+        # Updates start in the order given, as the Application would
+        # schedule them on arrival
+        started = time.perf_counter()
+        self.tracing = True
+        try:
+            await asyncio.gather(*(
+                self.processor.process_update(update, self.handle(handler, update))
+                for handler, update in updates
+            ))
+        finally:
+            self.tracing = False
+            self.elapsed += time.perf_counter() - started
+
+    def report(self):
+        count = len(self.latencies)
+        latencies = sorted(seconds * 1000 for seconds in self.latencies)
+        return {
+            'updates': count,
+            'seconds': round(self.elapsed, 4),
+            'updates_per_sec': round(count / self.elapsed, 1) if self.elapsed else 0.0,
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p95_ms': round(percentile(latencies, 95), 3),
+            'p99_ms': round(percentile(latencies, 99), 3),
+            'max_ms': round(latencies[-1], 3) if latencies else 0.0,
+            'queries': self.queries,
+            'queries_per_update': round(self.queries / count, 2) if count else 0.0,
+            'api_calls': dict(sorted(self.fake_bot.calls.items())),
+        }
+
+async def registration_rush(harness, teams, users):
+    # More users than slots race to register for one tournament; each walks
+    # through every registration step, interleaved with everyone else
+    tournament_id = await harness.app.db.create_tournament("Rush", teams)
+    player_ids = range(100, 100 + users)
+
+    steps = [
+        lambda user_id: harness.button(user_id, 'start_registration', tournament_id),
+        lambda user_id: harness.text(user_id, f"Team {user_id}"),
+        lambda user_id: harness.text(user_id, f"@player{user_id}"),
+        lambda user_id: harness.text(user_id, "\n".join(f"p{user_id}_{n}" for n in range(4))),
+    ]
+    steps += [lambda user_id, n=n: harness.photo(user_id, f"photo{user_id}_{n}") for n in range(4)]
+
+    await harness.dispatch([step(user_id) for step in steps for user_id in player_ids])
+    return tournament_id
+
+async def bracket_storm(harness, tournament_id, viewers, rng):
+    # Players hammer the read-only views once the bracket is up
+    await harness.app.db.create_bracket(tournament_id)
+    views = [
+        ('show_bracket', tournament_id),
+        ('show_current_matches', tournament_id),
+        ('tournament_details', tournament_id),
+        ('view_tournaments',),
+        ('view_archive',),
+    ]
+    updates = [harness.button(rng.randrange(1000, 1000 + viewers), *rng.choice(views)) for _ in range(viewers * 5)]
+    await harness.dispatch(updates)
+
+async def result_entry(harness, tournament_id, rng):
+    # The admin enters every result round by round until there is a champion
+    while True:
+        matches = await harness.app.db.get_current_matches(tournament_id)
+        if not matches:
+            break
+        await harness.dispatch([
+            harness.button(ADMIN_ID, 'set_match_winner', match[0], rng.choice((match[4], match[5])))
+            for match in matches
+        ])
+
+async def run(args):
+    # The bot reads its settings at import, so point it at a scratch
+    # database first
+    workdir = tempfile.mkdtemp(prefix='tournament-bench-')
+    os.environ.update({
+        'BOT_TOKEN': 'benchmark',
+        'ADMIN_IDS': str(ADMIN_ID),
+        'DB_PATH': os.path.join(workdir, 'tournament.db'),
+        'ARCHIVE_PATH': os.path.join(workdir, 'archive.db'),
+        'SESSION_BACKEND': 'sqlite',
+    })
+    import bot as app
+
+    harness = Harness(app, args.concurrency)
+    app.notifier.start(harness.fake_bot)
+    app.live.start(harness.fake_bot)
+    rng = random.Random(args.seed)
+    results = {}
+
+    try:
+        tournament_id = await registration_rush(harness, args.teams, args.users)
+        results['registration_rush'] = harness.report()
+
+        harness.reset()
+        await bracket_storm(harness, tournament_id, args.viewers, rng)
+        results['bracket_storm'] = harness.report()
+
+        harness.reset()
+        await result_entry(harness, tournament_id, rng)
+        results['result_entry'] = harness.report()
+    finally:
+        # Admin notifications drain at Telegram's per-chat rate, which
+        # would dominate the run, so whatever is still queued is dropped
+        for task in app.notifier.tasks:
+            task.cancel()
+        await app.live.stop()
+        app.database.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+def print_results(results, baseline=None):
+    columns = ('updates', 'updates_per_sec', 'p50_ms', 'p95_ms', 'p99_ms', 'queries_per_update')
+    print(f"{'scenario':<20}" + ''.join(f"{column:>20}" for column in columns))
+    for name in SCENARIOS:
+        result = results[name]
+        row = f"{name:<20}"
+        for column in columns:
+            cell = f"{result[column]}"
+            if baseline and name in baseline and baseline[name].get(column):
+                change = (result[column] - baseline[name][column]) / baseline[name][column] * 100
+                cell += f" ({change:+.0f}%)"
+            row += f"{cell:>20}"
+        print(row)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay synthetic load against TournamentBot")
+    parser.add_argument('--teams', type=int, default=64, help="tournament size for the registration rush")
+    parser.add_argument('--users', type=int, default=80, help="users racing to register")
+    parser.add_argument('--viewers', type=int, default=200, help="users in the bracket viewing storm")
+    parser.add_argument('--concurrency', type=int, default=8, help="updates handled at once")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--save', help="write results to this JSON file")
+    parser.add_argument('--compare', help="show changes against a saved JSON file")
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run(args))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as stream:
+            baseline = json.load(stream)
+    print_results(results, baseline)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as stream:
+            json.dump(results, stream, indent=2)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
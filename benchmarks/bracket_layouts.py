@@ -0,0 +1,101 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bracket import BYE, LAYOUTS, build_single_elimination, layout_slots
+from config import TOURNAMENT_SIZES
+
+# Property checks for the round-one layouts in bracket.py, followed by a
+# benchmark that builds 10k brackets.
+#
+#   python benchmarks/bracket_layouts.py
+#
+# For every field of 2 to --max-teams teams, both layouts and several
+# random seeds:
+#   - every team is placed exactly once
+#   - no match is BYE v BYE
+#   - the byes go to the top of the draw order (seeds 1, 2, ... for
+#     standard, the start of the shuffled order for random)
+#   - seeds 1 and 2 are in opposite halves, and seeds 1-4 in different
+#     quarters once there are four quarters
+#   - the same seed gives the same draw
+
+def draw_order(team_ids, layout, seed):
+    if layout == 'random':
+        shuffled = list(team_ids)
+        random.Random(seed).shuffle(shuffled)
+        return shuffled
+    return list(team_ids)
+
+def check(team_ids, layout, seed):
+    count = len(team_ids)
+    size = 1 << (count - 1).bit_length()
+    slots = layout_slots(team_ids, size, layout, seed)
+    where = f"{layout} layout, {count} teams, seed {seed}"
+
+    assert len(slots) == size, f"{where}: {len(slots)} slots"
+    placed = [slot for slot in slots if slot != BYE]
+    assert sorted(placed) == sorted(team_ids), f"{where}: teams placed {placed}"
+
+    pairs = [slots[i:i + 2] for i in range(0, size, 2)]
+    assert [BYE, BYE] not in pairs, f"{where}: BYE v BYE"
+
+    order = draw_order(team_ids, layout, seed)
+    byes = size - count
+    given_byes = {a if b == BYE else b for a, b in pairs if BYE in (a, b)}
+    assert given_byes == set(order[:byes]), f"{where}: byes went to {sorted(given_byes)}"
+
+    if count >= 2:
+        half = size // 2
+        first, second = slots.index(order[0]), slots.index(order[1])
+        assert (first < half) != (second < half), f"{where}: seeds 1 and 2 in the same half"
+    if count >= 4 and size >= 4:
+        quarter = size // 4
+        quarters = {slots.index(team) // quarter for team in order[:4]}
+        assert len(quarters) == 4, f"{where}: seeds 1-4 share a quarter"
+
+    assert layout_slots(team_ids, size, layout, seed) == slots, f"{where}: draw not reproducible"
+
+def run_checks(max_teams, seeds):
+    checked = 0
+    for count in range(2, max_teams + 1):
+        team_ids = list(range(101, 101 + count))
+        for layout in LAYOUTS:
+            for seed in (range(seeds) if layout == 'random' else [None]):
+                check(team_ids, layout, seed)
+                checked += 1
+    return checked
+
+def run_benchmark(brackets, seed):
+    rng = random.Random(seed)
+    fields = [list(range(1, rng.randint(2, rng.choice(TOURNAMENT_SIZES)) + 1)) for _ in range(brackets)]
+    results = {}
+    for layout in LAYOUTS:
+        started = time.perf_counter()
+        for number, team_ids in enumerate(fields):
+            build_single_elimination(team_ids, layout, number)
+        results[layout] = time.perf_counter() - started
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check bracket layouts and time bracket generation")
+    parser.add_argument('--max-teams', type=int, default=129)
+    parser.add_argument('--seeds', type=int, default=20, help="random seeds checked per field")
+    parser.add_argument('--brackets', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    checked = run_checks(args.max_teams, args.seeds)
+    print(f"{checked} layouts checked")
+
+    print(f"{args.brackets} brackets, fields of 2 to {max(TOURNAMENT_SIZES)} teams:")
+    for layout, seconds in run_benchmark(args.brackets, args.seed).items():
+        print(f"  {layout:<10} {seconds:.3f}s ({args.brackets / seconds:.0f} brackets/sec)")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,153 @@
+import argparse
+import csv
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bulk
+from database import Database
+
+# Teams/sec for bulk.py import on generated files, CSV and JSON Lines,
+# against registering the same teams one register_team call at a time, and
+# for an export of the imported teams read back into a new tournament. Each
+# variant gets a fresh database file.
+#
+#   python benchmarks/bulk_import.py --teams 20000 --per-tournament 1000
+#
+# Exits non-zero unless every variant stored every team with its full
+# roster and photos.
+
+ROSTER_SIZE = 4
+PHOTOS = 2
+
+def team_records(tournament_ids, per_tournament):
+    for tournament_id in tournament_ids:
+        for n in range(per_tournament):
+            name = f"Team {tournament_id}-{n}"
+            yield {
+                'tournament_id': tournament_id,
+                'name': name,
+                'leader_username': f"@lead{tournament_id}_{n}",
+                'roster': [f"player{tournament_id}_{n}_{p}" for p in range(ROSTER_SIZE)],
+                'photos': [f"photo{tournament_id}_{n}_{p}" for p in range(PHOTOS)],
+            }
+
+def write_csv(records):
+    out = io.StringIO()
+    writer = csv.DictWriter(out, ['tournament_id', 'name', 'leader_username', 'roster', 'photos'])
+    writer.writeheader()
+    for record in records:
+        writer.writerow({**record, 'roster': ';'.join(record['roster']), 'photos': ';'.join(record['photos'])})
+    return out.getvalue()
+
+def write_jsonl(records):
+    return ''.join(json.dumps(record) + '\n' for record in records)
+
+def create_tournaments(db, count, per_tournament):
+    return [db.create_tournament(f"Import {n}", per_tournament) for n in range(count)]
+
+def stored(db):
+    # (teams, members, photos) in the database
+    return tuple(
+        db.conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+        for table in ('teams', 'team_members', 'team_photos')
+    )
+
+def run_variant(workdir, label, tournaments, per_tournament, prepare):
+    # prepare(db, records) returns the call to time, so generating the
+    # input file is left out of the timing
+    db = Database(os.path.join(workdir, f'{label}.db'), cache_size=0)
+    try:
+        tournament_ids = create_tournaments(db, tournaments, per_tournament)
+        load = prepare(db, list(team_records(tournament_ids, per_tournament)))
+        started = time.perf_counter()
+        load()
+        elapsed = time.perf_counter() - started
+        return elapsed, stored(db)
+    finally:
+        db.close()
+
+def one_by_one(db, records):
+    def load():
+        for record in records:
+            success, error, _ = db.register_team(
+                record['tournament_id'], record['name'], record['leader_username'], record['roster'], record['photos']
+            )
+            assert success, error
+    return load
+
+def from_file(file_format):
+    write = write_csv if file_format == 'csv' else write_jsonl
+
+    def prepare(db, records):
+        text = write(records)
+        return lambda: bulk.import_teams(db, io.StringIO(text), file_format)
+    return prepare
+
+def round_trip(workdir, per_tournament):
+    # Export one full tournament and import its teams into a new one
+    db = Database(os.path.join(workdir, 'round_trip.db'), cache_size=0)
+    try:
+        source, target = create_tournaments(db, 2, per_tournament)
+        bulk.import_teams(db, io.StringIO(write_jsonl(team_records([source], per_tournament))), 'jsonl')
+        exported = io.StringIO()
+        bulk.export_tournament(db, source, exported)
+        skipped = Counter()
+        text = exported.getvalue()
+        started = time.perf_counter()
+        count = bulk.import_teams(db, io.StringIO(text), 'jsonl', target, skipped)
+        elapsed = time.perf_counter() - started
+        return elapsed, count, skipped
+    finally:
+        db.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time bulk team imports against one registration at a time")
+    parser.add_argument('--teams', type=int, default=5000, help="teams per variant")
+    parser.add_argument('--per-tournament', type=int, default=500, help="teams per tournament")
+    args = parser.parse_args(argv)
+
+    tournaments = max(1, args.teams // args.per_tournament)
+    teams = tournaments * args.per_tournament
+    expected = (teams, teams * ROSTER_SIZE, teams * PHOTOS)
+
+    workdir = tempfile.mkdtemp(prefix='tournament-bulk-')
+    failed = False
+    try:
+        variants = [
+            ('register_team', one_by_one),
+            ('import csv', from_file('csv')),
+            ('import jsonl', from_file('jsonl')),
+        ]
+        print(f"{teams} teams in {tournaments} tournaments")
+        print(f"{'variant':<16}{'seconds':>10}{'teams/sec':>12}{'speedup':>10}")
+        baseline = None
+        for label, prepare in variants:
+            elapsed, counts = run_variant(workdir, label.replace(' ', '_'), tournaments, args.per_tournament, prepare)
+            baseline = baseline or elapsed
+            print(f"{label:<16}{elapsed:>10.2f}{teams / elapsed:>12.0f}{baseline / elapsed:>9.1f}x")
+            if counts != expected:
+                print(f"  stored {counts}, expected {expected}")
+                failed = True
+
+        elapsed, count, skipped = round_trip(workdir, args.per_tournament)
+        print(f"{'export reimport':<16}{elapsed:>10.2f}{count / elapsed:>12.0f}"
+              f"   skipped {dict(skipped)}")
+        if count != args.per_tournament:
+            print(f"  reimported {count} teams, expected {args.per_tournament}")
+            failed = True
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print("ok" if not failed else "FAILED")
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
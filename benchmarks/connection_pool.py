@@ -0,0 +1,99 @@
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+
+# Operations per second for the Database methods, with the shared tuned
+# connection against a connection opened and closed on every call, as
+# Database used to work. Each variant gets its own database file; the read
+# cache is turned off so every call reaches SQLite.
+#
+#   python benchmarks/connection_pool.py --reads 5000 --writes 500
+
+class ConnectPerCall(Database):
+    # Database as it was: a fresh connection with SQLite's defaults
+    # (rollback journal, synchronous FULL) for every call
+    def connect(self):
+        return sqlite3.connect(self.db_path, isolation_level=None)
+
+    @contextmanager
+    def cursor(self, write=False):
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        cursor = conn.cursor()
+        try:
+            if write:
+                cursor.execute('BEGIN IMMEDIATE')
+            yield cursor
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+
+def roster(n):
+    return [f"player{n}_{position}" for position in range(4)]
+
+def workload(db, reads, writes):
+    # (method name, calls, seconds)
+    results = []
+
+    def timed(name, calls, call):
+        started = time.perf_counter()
+        for n in range(calls):
+            call(n)
+        results.append((name, calls, time.perf_counter() - started))
+
+    tournament_ids = []
+    timed('create_tournament', writes, lambda n: tournament_ids.append(db.create_tournament(f"Cup {n}", 64)))
+    tournament_id = tournament_ids[0]
+    timed('register_team', min(writes, 64), lambda n: db.register_team(tournament_id, f"Team {n}", f"lead{n}", roster(n), [f"photo{n}"]))
+    team_id = db.get_tournament_teams(tournament_id).rows[0][0]
+
+    timed('get_tournament', reads, lambda n: db.get_tournament(tournament_ids[n % len(tournament_ids)]))
+    timed('get_active_tournaments', reads, lambda n: db.get_active_tournaments())
+    timed('get_tournament_teams', reads, lambda n: db.get_tournament_teams(tournament_id))
+    timed('get_team_details', reads, lambda n: db.get_team_details(team_id))
+    timed('get_user_teams', reads, lambda n: db.get_user_teams(f"player{n % 64}_0"))
+
+    db.create_bracket(tournament_id)
+    timed('get_current_matches', reads, lambda n: db.get_current_matches(tournament_id))
+    timed('get_bracket', reads, lambda n: db.get_bracket(tournament_id))
+    return results
+
+def run(variant, reads, writes):
+    workdir = tempfile.mkdtemp(prefix='tournament-pool-')
+    try:
+        db = variant(os.path.join(workdir, 'tournament.db'), cache_size=0)
+        try:
+            return workload(db, reads, writes)
+        finally:
+            db.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare connect-per-call with the shared Database connection")
+    parser.add_argument('--reads', type=int, default=2000, help="calls per read method")
+    parser.add_argument('--writes', type=int, default=200, help="calls per write method")
+    args = parser.parse_args(argv)
+
+    before = run(ConnectPerCall, args.reads, args.writes)
+    after = run(Database, args.reads, args.writes)
+
+    print(f"{'method':<24}{'connect per call':>20}{'shared connection':>20}{'speedup':>10}")
+    for (name, calls, old), (_, _, new) in zip(before, after):
+        print(f"{name:<24}{calls / old:>14.0f} ops/s{calls / new:>14.0f} ops/s{old / new:>9.1f}x")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,138 @@
+import asyncio
+import itertools
+import json
+import time
+from collections import Counter
+from urllib.parse import parse_qs
+
+# A local stand-in for the Telegram Bot API. It speaks just enough HTTP/1.1
+# for python-telegram-bot's HTTPXRequest, answers every method with a
+# plausible result and records each call with its arrival time, so a real
+# telegram.Bot can be pointed at it:
+#
+#   async with FakeTelegram() as api:
+#       bot = Bot(api.token, base_url=api.base_url)
+#
+# flood_every makes every nth send fail with a 429 and retry_after, to
+# exercise flood-limit handling. Updates added with push_updates are served
+# to getUpdates, for running a bot in polling mode.
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Fake', 'username': 'fake_bot'}
+
+class FakeTelegram:
+    def __init__(self, token='123:fake', flood_every=0, retry_after=1):
+        self.token = token
+        self.flood_every = flood_every
+        self.retry_after = retry_after
+        self.calls = []  # (arrival time, method, params)
+        self.counts = Counter()
+        self.message_ids = itertools.count(1)
+        self.updates = []
+        self.updates_ready = asyncio.Event()
+        self.server = None
+        self.port = None
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.port}/bot'
+
+    async def __aenter__(self):
+        self.server = await asyncio.start_server(self.serve, '127.0.0.1', 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc_info):
+        # Let a pending long poll answer before the server goes away
+        self.updates_ready.set()
+        self.server.close()
+        await self.server.wait_closed()
+
+    def push_updates(self, updates):
+        self.updates.extend(updates)
+        self.updates_ready.set()
+
+    def sent(self, method=None):
+        return [call for call in self.calls if method is None or call[1] == method]
+
+    async def serve(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while (line := await reader.readline()) not in (b'\r\n', b''):
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                path = request_line.split()[1].decode()
+                method = path.rsplit('/', 1)[-1]
+                status, payload = await self.answer(method, self.parse(headers, body))
+                data = json.dumps(payload).encode()
+                writer.write(
+                    f'HTTP/1.1 {status}\r\nContent-Type: application/json\r\n'
+                    f'Content-Length: {len(data)}\r\n\r\n'.encode() + data
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def parse(self, headers, body):
+        content_type = headers.get('content-type', '')
+        if content_type.startswith('application/json'):
+            return json.loads(body or b'{}')
+        if content_type.startswith('application/x-www-form-urlencoded'):
+            return {key: values[0] for key, values in parse_qs(body.decode()).items()}
+        # Multipart uploads aren't inspected; the call is still counted
+        return {}
+
+    async def answer(self, method, params):
+        if method == 'getMe':
+            return '200 OK', {'ok': True, 'result': BOT_USER}
+        if method == 'getUpdates':
+            return '200 OK', {'ok': True, 'result': await self.get_updates(params)}
+
+        self.counts[method] += 1
+        if self.flood_every and self.counts[method] % self.flood_every == 0:
+            return '429 Too Many Requests', {
+                'ok': False, 'error_code': 429,
+                'description': f'Too Many Requests: retry after {self.retry_after}',
+                'parameters': {'retry_after': self.retry_after},
+            }
+
+        self.calls.append((time.perf_counter(), method, params))
+        chat_id = int(params.get('chat_id', 0) or 0)
+        if method == 'sendMediaGroup':
+            media = params.get('media', '[]')
+            count = len(json.loads(media) if isinstance(media, str) else media)
+            return '200 OK', {'ok': True, 'result': [self.message(chat_id) for _ in range(count)]}
+        if method.startswith('send') or method.startswith('edit'):
+            return '200 OK', {'ok': True, 'result': self.message(chat_id, params.get('text'))}
+        return '200 OK', {'ok': True, 'result': True}
+
+    async def get_updates(self, params):
+        # Long poll: confirm everything before offset, then wait up to
+        # timeout for something new
+        offset = int(params.get('offset') or 0)
+        self.updates = [update for update in self.updates if update['update_id'] >= offset]
+        if not self.updates:
+            self.updates_ready.clear()
+            try:
+                await asyncio.wait_for(self.updates_ready.wait(), float(params.get('timeout') or 0))
+            except asyncio.TimeoutError:
+                pass
+        return self.updates[:int(params.get('limit') or 100)]
+
+    def message(self, chat_id, text=None):
+        message = {
+            'message_id': next(self.message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': BOT_USER,
+        }
+        if text is not None:
+            message['text'] = text
+        return message
@@ -0,0 +1,111 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+
+# Query times on a database seeded with thousands of finished tournaments,
+# with the lookup indexes from the migrations and again after dropping
+# them. The hot paths should stay flat as history grows; without the
+# indexes they scan every team, member or match ever stored.
+#
+#   python benchmarks/index_queries.py --tournaments 5000
+
+# Secondary indexes added by migrations for the lookups timed below
+LOOKUP_INDEXES = (
+    'idx_tournaments_status',
+    'idx_teams_tournament_name',
+    'idx_teams_tournament',
+    'idx_matches_tournament_round',
+    'idx_matches_position',
+    'idx_team_members_username',
+    'idx_teams_leader',
+)
+
+TEAMS_PER_TOURNAMENT = 16
+
+def seed_history(db, tournaments):
+    # Finished tournaments with full rosters and every match played,
+    # written in one transaction
+    with db.cursor(write=True) as cursor:
+        cursor.executemany(
+            "INSERT INTO tournaments (id, name, max_teams, current_teams, status) VALUES (?, ?, ?, ?, 'completed')",
+            [(t, f"Cup {t}", TEAMS_PER_TOURNAMENT, TEAMS_PER_TOURNAMENT) for t in range(1, tournaments + 1)]
+        )
+        teams = [
+            ((t - 1) * TEAMS_PER_TOURNAMENT + n + 1, t, f"Team {n}", f"lead{t}_{n}")
+            for t in range(1, tournaments + 1) for n in range(TEAMS_PER_TOURNAMENT)
+        ]
+        cursor.executemany('INSERT INTO teams (id, tournament_id, name, leader_username) VALUES (?, ?, ?, ?)', teams)
+        cursor.executemany(
+            'INSERT INTO team_members (team_id, position, username) VALUES (?, ?, ?)',
+            [(team_id, position, f"player{team_id}_{position}") for team_id, *_ in teams for position in range(4)]
+        )
+        matches = []
+        for t in range(1, tournaments + 1):
+            first = (t - 1) * TEAMS_PER_TOURNAMENT + 1
+            for n in range(TEAMS_PER_TOURNAMENT - 1):
+                team_a, team_b = first + (2 * n) % TEAMS_PER_TOURNAMENT, first + (2 * n + 1) % TEAMS_PER_TOURNAMENT
+                matches.append((t, n.bit_length(), n + 1, team_a, team_b, team_a))
+        cursor.executemany(
+            "INSERT INTO matches (tournament_id, round_number, match_number, team_a_id, team_b_id, winner_id, status) VALUES (?, ?, ?, ?, ?, ?, 'completed')",
+            matches
+        )
+    return len(teams), len(matches)
+
+def time_queries(db, label, repeat):
+    # A live tournament filling up and then running, next to the history
+    tournament_id = db.create_tournament(f"Live {label}", TEAMS_PER_TOURNAMENT)
+    results = []
+
+    def timed(name, calls, call):
+        started = time.perf_counter()
+        for n in range(calls):
+            call(n)
+        results.append((name, (time.perf_counter() - started) / calls * 1000))
+
+    timed('register_team', TEAMS_PER_TOURNAMENT, lambda n: db.register_team(
+        tournament_id, f"Live {n}", f"live{label}{n}", [f"live{label}{n}_{p}" for p in range(4)], []
+    ))
+    timed('get_active_tournaments', repeat, lambda n: db.get_active_tournaments())
+    timed('get_tournament_teams', repeat, lambda n: db.get_tournament_teams(tournament_id))
+    timed('get_user_teams', repeat, lambda n: db.get_user_teams(f"player{n * 7 + 1}_0"))
+    db.create_bracket(tournament_id)
+    timed('get_current_matches', repeat, lambda n: db.get_current_matches(tournament_id))
+    timed('get_bracket', repeat, lambda n: db.get_bracket(tournament_id))
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare query times with and without the lookup indexes")
+    parser.add_argument('--tournaments', type=int, default=2000, help="finished tournaments to seed")
+    parser.add_argument('--repeat', type=int, default=200, help="calls per read query")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='tournament-index-')
+    try:
+        db = Database(os.path.join(workdir, 'tournament.db'), cache_size=0)
+        started = time.perf_counter()
+        teams, matches = seed_history(db, args.tournaments)
+        print(f"Seeded {args.tournaments} tournaments, {teams} teams, {matches} matches in {time.perf_counter() - started:.1f}s")
+
+        indexed = time_queries(db, 'indexed', args.repeat)
+        with db.lock:
+            for index in LOOKUP_INDEXES:
+                db.conn.execute(f'DROP INDEX IF EXISTS {index}')
+        unindexed = time_queries(db, 'unindexed', args.repeat)
+        db.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{'query':<24}{'indexed':>14}{'no indexes':>14}{'speedup':>10}")
+    for (name, fast), (_, slow) in zip(indexed, unindexed):
+        print(f"{name:<24}{fast:>11.3f} ms{slow:>11.3f} ms{slow / fast:>9.1f}x")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,127 @@
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import Bot
+from fake_telegram import FakeTelegram
+from notifications import PER_CHAT_RATE, NotificationDispatcher
+
+# End-to-end check of NotificationDispatcher against a local fake Bot API,
+# through a real telegram.Bot and HTTP. Each scenario asserts delivery and
+# reports latency from enqueue to the stub receiving the call.
+#
+#   python benchmarks/notifier_latency.py
+#
+#   direct   every admin gets a run of messages: all arrive, in order per
+#            chat, within the per-chat token bucket
+#   flood    the stub answers every 5th send with a 429: every message still
+#            arrives after retry_after
+#   digest   a burst of registrations reaches each admin as one text digest
+#            with no albums
+#   drain    stop() right after enqueueing still delivers everything
+
+PER_CHAT_BURST = 3  # capacity of the per-chat bucket
+
+def latency_report(name, enqueued, calls):
+    # enqueued maps (chat_id, text) to the time it was handed over
+    latencies = sorted(
+        (arrived - enqueued[(int(params['chat_id']), params['text'])]) * 1000
+        for arrived, method, params in calls if method == 'sendMessage'
+    )
+    quantiles = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else latencies * 99
+    print(f"{name:<8} {len(latencies):>5} sent   p50 {quantiles[49]:8.1f} ms   p95 {quantiles[94]:8.1f} ms   max {latencies[-1]:8.1f} ms")
+
+def check_order_and_rate(calls, chats, per_chat):
+    arrivals = {chat_id: [] for chat_id in chats}
+    for arrived, method, params in calls:
+        arrivals[int(params['chat_id'])].append((arrived, params['text']))
+    for chat_id, received in arrivals.items():
+        texts = [text for _, text in received]
+        assert texts == sorted(texts, key=lambda text: int(text.split('#')[1])), f"chat {chat_id} out of order"
+        assert len(texts) == per_chat, f"chat {chat_id} got {len(texts)} of {per_chat}"
+        # No window may hold more than the bucket allows
+        times = [arrived for arrived, _ in received]
+        for i in range(len(times)):
+            for j in range(i + PER_CHAT_BURST, len(times)):
+                allowed = PER_CHAT_BURST + (times[j] - times[i]) * PER_CHAT_RATE + 0.05
+                assert j - i + 1 <= allowed, f"chat {chat_id} exceeded the per-chat rate"
+
+async def send_runs(api, chats, per_chat):
+    bot = Bot(api.token, base_url=api.base_url)
+    async with bot:
+        notifier = NotificationDispatcher()
+        notifier.start(bot)
+        enqueued = {}
+        for number in range(per_chat):
+            for chat_id in chats:
+                text = f"message #{number}"
+                enqueued[(chat_id, text)] = time.perf_counter()
+                notifier.send_message([chat_id], text)
+        await notifier.stop()
+    return enqueued
+
+async def direct(chats, per_chat):
+    async with FakeTelegram() as api:
+        enqueued = await send_runs(api, chats, per_chat)
+        check_order_and_rate(api.sent(), chats, per_chat)
+        latency_report('direct', enqueued, api.sent())
+
+async def flood(chats, per_chat):
+    async with FakeTelegram(flood_every=5, retry_after=1) as api:
+        enqueued = await send_runs(api, chats, per_chat)
+        assert len(api.sent('sendMessage')) == len(chats) * per_chat, "messages lost to 429s"
+        latency_report('flood', enqueued, api.sent())
+
+async def digest(chats, registrations):
+    async with FakeTelegram() as api:
+        bot = Bot(api.token, base_url=api.base_url)
+        async with bot:
+            notifier = NotificationDispatcher(digest_window=0.2)
+            notifier.start(bot)
+            enqueued = {}
+            for number in range(registrations):
+                notifier.send_digest(chats, 'registrations', f"Team #{number} registered", ['photo'])
+            started = time.perf_counter()
+            await asyncio.sleep(0.3)
+            await notifier.stop()
+        messages = api.sent('sendMessage')
+        assert not api.sent('sendMediaGroup'), "digest sent albums"
+        for chat_id in chats:
+            received = [params['text'] for _, _, params in messages if int(params['chat_id']) == chat_id]
+            assert all(f"Team #{number} registered" in "".join(received) for number in range(registrations))
+            # Everything fits in one message at this size
+            assert len(received) == 1, f"chat {chat_id} got {len(received)} digest messages"
+        for _, _, params in messages:
+            enqueued[(int(params['chat_id']), params['text'])] = started
+        latency_report('digest', enqueued, messages)
+
+async def drain(chats, per_chat):
+    async with FakeTelegram() as api:
+        enqueued = await send_runs(api, chats, per_chat)
+        assert len(api.sent()) == len(enqueued), "stop() dropped queued messages"
+        latency_report('drain', enqueued, api.sent())
+
+async def run(args):
+    chats = list(range(1000, 1000 + args.admins))
+    await direct(chats, args.messages)
+    await flood(chats, args.messages)
+    await digest(chats, args.registrations)
+    await drain(chats, PER_CHAT_BURST)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check admin notifications against a fake Bot API")
+    parser.add_argument('--admins', type=int, default=5)
+    parser.add_argument('--messages', type=int, default=6, help="messages per admin")
+    parser.add_argument('--registrations', type=int, default=64, help="registrations in the digest burst")
+    args = parser.parse_args(argv)
+    asyncio.run(run(args))
+    print("ok")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,103 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+
+# Races registrations at one tournament from many threads, each with its own
+# Database and so its own SQLite connection, the way separate bot processes
+# would share the file. Every thread waits on a barrier and then registers
+# as fast as it can. Some team names are taken by more than one thread, so
+# the duplicate-name check races as well as the slot count.
+#
+#   python benchmarks/registration_stress.py --threads 32 --attempts 400
+#
+# Exits non-zero unless exactly --slots teams got in, with current_teams,
+# the teams table and the successful calls all agreeing.
+
+def worker(db_path, tournament_id, names, barrier, outcomes, lock):
+    db = Database(db_path)
+    results = Counter()
+    barrier.wait()
+    try:
+        for name in names:
+            success, message, _ = db.register_team(tournament_id, name, f"@{name}", [f"{name}_{n}" for n in range(4)], [])
+            results['registered' if success else message] += 1
+    finally:
+        db.close()
+    with lock:
+        outcomes.update(results)
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='tournament-stress-')
+    db_path = os.path.join(workdir, 'tournament.db')
+    try:
+        setup = Database(db_path)
+        tournament_id = setup.create_tournament("Stress", args.slots)
+
+        # One name in every duplicate_every attempts is shared with the
+        # next thread
+        names = [f"team{n}" for n in range(args.attempts)]
+        for n in range(0, args.attempts - 1, args.duplicate_every):
+            names[n + 1] = names[n]
+        per_thread = [names[i::args.threads] for i in range(args.threads)]
+
+        barrier = threading.Barrier(args.threads + 1)
+        outcomes = Counter()
+        lock = threading.Lock()
+        threads = [
+            threading.Thread(target=worker, args=(db_path, tournament_id, chunk, barrier, outcomes, lock))
+            for chunk in per_thread
+        ]
+        for thread in threads:
+            thread.start()
+        barrier.wait()
+        started = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        with setup.cursor() as cursor:
+            cursor.execute('SELECT current_teams FROM tournaments WHERE id = ?', (tournament_id,))
+            current_teams = cursor.fetchone()[0]
+            cursor.execute('SELECT COUNT(*), COUNT(DISTINCT name) FROM teams WHERE tournament_id = ?', (tournament_id,))
+            teams, distinct = cursor.fetchone()
+            cursor.execute('SELECT COUNT(*) FROM team_members')
+            members = cursor.fetchone()[0]
+        setup.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    attempts = sum(outcomes.values())
+    print(f"{attempts} registrations from {args.threads} threads in {elapsed:.3f}s ({attempts / elapsed:.0f}/sec)")
+    for outcome, count in outcomes.most_common():
+        print(f"  {count:>6}  {outcome}")
+    print(f"current_teams {current_teams}, teams {teams} ({distinct} distinct), members {members}")
+
+    expected = min(args.slots, len(set(names)))
+    ok = (
+        attempts == args.attempts
+        and outcomes['registered'] == current_teams == teams == distinct == expected
+        and members == teams * 4
+    )
+    print("ok" if ok else f"FAILED: expected exactly {expected} teams")
+    return 0 if ok else 1
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Race concurrent registrations against one tournament")
+    parser.add_argument('--slots', type=int, default=64)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--attempts', type=int, default=400, help="registrations across all threads")
+    parser.add_argument('--duplicate-every', type=int, default=5, help="make one in this many names a duplicate")
+    args = parser.parse_args(argv)
+    return run(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
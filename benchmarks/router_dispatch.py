@@ -0,0 +1,118 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Cost of routing one button tap, for every callback the bot registers:
+# decoding the payload and looking up the TournamentBot method, without
+# running it. For comparison, the startswith chain that button_handler used
+# before the router is timed on its own payload formats.
+#
+#   python benchmarks/router_dispatch.py --number 200000
+
+# Payloads of the old chain with the route each one reached
+LEGACY_PAYLOADS = [
+    ('create_tournament_start', 'create_tournament'),
+    ('admin_panel', 'admin_panel'),
+    ('view_tournaments', 'view_tournaments'),
+    ('tournament_details', 'tournament_12'),
+    ('start_registration', 'register_12'),
+    ('show_team_details', 'view_team_345'),
+    ('delete_tournament', 'delete_tournament_12'),
+    ('delete_team', 'delete_team_345'),
+    ('start_bracket', 'start_bracket_12'),
+    ('set_match_winner', 'match_6789_345'),
+]
+
+def legacy_dispatch(bot, data):
+    # button_handler's chain before the router, minus the awaits
+    if data == "create_tournament":
+        return bot.create_tournament_start, ()
+    elif data == "admin_panel":
+        return bot.admin_panel, ()
+    elif data == "view_tournaments":
+        return bot.view_tournaments, ()
+    elif data.startswith("tournament_"):
+        return bot.tournament_details, (int(data.split("_")[1]),)
+    elif data.startswith("register_"):
+        return bot.start_registration, (int(data.split("_")[1]),)
+    elif data.startswith("view_team_"):
+        return bot.show_team_details, (int(data.split("_")[2]),)
+    elif data.startswith("delete_tournament_"):
+        return bot.delete_tournament, (int(data.split("_")[2]),)
+    elif data.startswith("delete_team_"):
+        return bot.delete_team, (int(data.split("_")[2]),)
+    elif data.startswith("start_bracket_"):
+        return bot.start_bracket, (int(data.split("_")[2]),)
+    elif data.startswith("match_"):
+        match_data = data.split("_")
+        return bot.set_match_winner, (int(match_data[1]), int(match_data[2]))
+    return None
+
+def router_dispatch(bot, callbacks, data):
+    # button_handler's routing, minus the awaits
+    decoded = callbacks.decode(data)
+    if decoded is None:
+        return None
+    route, args = decoded
+    return getattr(bot, route.name), args
+
+def payloads(callbacks):
+    # Every route with all of its arguments filled in
+    return {
+        name: callbacks.encode(name, *[12, 345, 6789][:route.arg_count])
+        for name, route in callbacks.routes.items()
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time callback dispatch for every registered button")
+    parser.add_argument('--number', type=int, default=100000, help="dispatches timed per payload")
+    args = parser.parse_args(argv)
+
+    # The bot reads its settings at import
+    workdir = tempfile.mkdtemp(prefix='tournament-router-')
+    os.environ.update({
+        'BOT_TOKEN': 'router', 'ADMIN_IDS': '1', 'SESSION_BACKEND': 'memory',
+        'DB_PATH': os.path.join(workdir, 'tournament.db'), 'ARCHIVE_PATH': '',
+    })
+    import bot as app
+    try:
+        bot = app.TournamentBot()
+        callbacks = app.callbacks
+
+        def per_call(function, *call_args):
+            seconds = min(timeit.repeat(lambda: function(*call_args), number=args.number, repeat=3))
+            return seconds / args.number * 1e9
+
+        print(f"{'route':<26}{'payload':<18}{'router ns':>10}{'old chain ns':>14}")
+        legacy = dict(LEGACY_PAYLOADS)
+        router_total = legacy_total = 0.0
+        for name, data in payloads(callbacks).items():
+            assert router_dispatch(bot, callbacks, data)[0].__name__ == name
+            cost = per_call(router_dispatch, bot, callbacks, data)
+            router_total += cost
+            old = ''
+            if name in legacy:
+                assert legacy_dispatch(bot, legacy[name])[0].__name__ == name
+                old_cost = per_call(legacy_dispatch, bot, legacy[name])
+                legacy_total += old_cost
+                old = f"{old_cost:.0f}"
+            print(f"{name:<26}{data:<18}{cost:>10.0f}{old:>14}")
+
+        for label, data in (('unknown prefix', 'zz9:1'), ('stale version', 'w0:1:2'), ('malformed args', 'w1:1:x')):
+            assert router_dispatch(bot, callbacks, data) is None
+            print(f"{label:<26}{data:<18}{per_call(router_dispatch, bot, callbacks, data):>10.0f}")
+
+        routes = len(callbacks.routes)
+        print(f"mean over {routes} routes: {router_total / routes:.0f} ns; old chain over {len(legacy)}: {legacy_total / len(legacy):.0f} ns")
+    finally:
+        app.database.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
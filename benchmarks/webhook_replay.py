@@ -0,0 +1,230 @@
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from telegram import Update
+from telegram.ext import Application, TypeHandler
+from fake_telegram import BOT_USER, FakeTelegram
+
+# Replays updates through the real Application, once in webhook mode, by
+# POSTing them to the embedded server, and once in polling mode, by serving
+# them from getUpdates, and compares updates/sec and latency. Bot API calls
+# go to a local fake, so no token or network is needed.
+#
+#   python benchmarks/webhook_replay.py --users 60
+#   python benchmarks/webhook_replay.py --updates recorded.jsonl --rate 200
+#
+# Without --updates, each user walks through /start, the tournament list
+# and details and the first registration steps. A recorded file holds one
+# Update JSON object per line; update ids are renumbered. --rate spreads
+# the updates over time instead of releasing them all at once. Latency is
+# from an update's release (POST or becoming available to getUpdates) to
+# its handler finishing.
+
+TOKEN = '123:replay'
+SECRET = 'replay-secret'
+ADMIN_ID = 1
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def synthetic_updates(app, tournament_id, first_user, users):
+    def user(user_id):
+        return {'id': user_id, 'is_bot': False, 'first_name': f"player{user_id}", 'username': f"player{user_id}"}
+
+    def message(user_id, text, entities=None):
+        payload = {
+            'message_id': 1, 'date': int(time.time()), 'text': text,
+            'chat': {'id': user_id, 'type': 'private'}, 'from': user(user_id),
+        }
+        if entities:
+            payload['entities'] = entities
+        return {'message': payload}
+
+    def button(user_id, name, *args):
+        return {'callback_query': {
+            'id': str(user_id), 'chat_instance': str(user_id), 'from': user(user_id),
+            'data': app.callbacks.encode(name, *args),
+            'message': {
+                'message_id': 1, 'date': int(time.time()), 'text': "menu",
+                'chat': {'id': user_id, 'type': 'private'}, 'from': BOT_USER,
+            },
+        }}
+
+    steps = [
+        lambda user_id: message(user_id, '/start', [{'type': 'bot_command', 'offset': 0, 'length': 6}]),
+        lambda user_id: button(user_id, 'view_tournaments'),
+        lambda user_id: button(user_id, 'tournament_details', tournament_id),
+        lambda user_id: button(user_id, 'start_registration', tournament_id),
+        lambda user_id: message(user_id, f"Team {user_id}"),
+        lambda user_id: message(user_id, f"@player{user_id}"),
+        lambda user_id: message(user_id, "\n".join(f"p{user_id}_{n}" for n in range(4))),
+    ]
+    # Users interleave, as they would at a signup peak
+    return [step(user_id) for step in steps for user_id in range(first_user, first_user + users)]
+
+def load_updates(path):
+    with open(path, encoding='utf-8') as stream:
+        return [json.loads(line) for line in stream if line.strip()]
+
+async def release(updates, rate, send):
+    # Hands each update to send at its scheduled time; returns release times
+    released = {}
+    started = time.perf_counter()
+    for update in updates:
+        if rate:
+            delay = started + len(released) / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        released[update['update_id']] = time.perf_counter()
+        await send(update)
+    return released
+
+async def post_updates(url, updates, args):
+    # Telegram opens up to max_connections (default 40) at once
+    limits = httpx.Limits(max_connections=args.connections)
+    async with httpx.AsyncClient(limits=limits) as client:
+        response = await client.post(url, json=updates[0], headers={'X-Telegram-Bot-Api-Secret-Token': 'wrong'})
+        assert response.status_code == 403, f"wrong secret accepted: {response.status_code}"
+
+        posts = []
+
+        async def post(update):
+            posts.append(asyncio.create_task(
+                client.post(url, json=update, headers={'X-Telegram-Bot-Api-Secret-Token': SECRET})
+            ))
+
+        released = await release(updates, args.rate, post)
+        for response in await asyncio.gather(*posts):
+            assert response.status_code == 200, f"webhook answered {response.status_code}"
+    return released
+
+async def run_mode(app, mode, updates, args):
+    async with FakeTelegram(TOKEN) as api:
+        application = (
+            Application.builder()
+            .token(TOKEN)
+            .base_url(api.base_url)
+            .concurrent_updates(app.ChatUpdateProcessor(args.concurrency))
+            .build()
+        )
+        app.add_handlers(application, app.TournamentBot())
+
+        # A later handler group runs once an update's handler has finished
+        handled = {}
+        finished = asyncio.Event()
+
+        async def mark_handled(update, context):
+            handled[update.update_id] = time.perf_counter()
+            if len(handled) == len(updates):
+                finished.set()
+
+        application.add_handler(TypeHandler(Update, mark_handled), group=1)
+
+        await application.initialize()
+        await app.post_init(application)
+        await application.start()
+        try:
+            if mode == 'webhook':
+                port = free_port()
+                await application.updater.start_webhook(
+                    listen='127.0.0.1', port=port, url_path='telegram', secret_token=SECRET,
+                    webhook_url=f'http://127.0.0.1:{port}/telegram'
+                )
+                url = f'http://127.0.0.1:{port}/telegram'
+                # Telegram posts from outside the bot's process, so the
+                # client gets its own thread and event loop
+                released = await asyncio.to_thread(asyncio.run, post_updates(url, updates, args))
+            else:
+                await application.updater.start_polling(poll_interval=0, timeout=10)
+
+                async def push(update):
+                    api.push_updates([update])
+
+                released = await release(updates, args.rate, push)
+
+            await asyncio.wait_for(finished.wait(), args.timeout)
+        finally:
+            if application.updater.running:
+                await application.updater.stop()
+            await application.stop()
+            # Queued admin notifications would drain at the per-chat rate
+            for task in app.notifier.tasks:
+                task.cancel()
+            await app.live.stop()
+            await application.shutdown()
+
+    latencies = sorted((handled[update_id] - released[update_id]) * 1000 for update_id in released)
+    elapsed = max(handled.values()) - min(released.values())
+    quantiles = statistics.quantiles(latencies, n=100, method='inclusive')
+    return {
+        'updates': len(latencies),
+        'seconds': elapsed,
+        'updates_per_sec': len(latencies) / elapsed,
+        'p50_ms': quantiles[49],
+        'p95_ms': quantiles[94],
+        'api_calls': len(api.sent()),
+    }
+
+async def run(args):
+    workdir = tempfile.mkdtemp(prefix='tournament-replay-')
+    os.environ.update({
+        'BOT_TOKEN': TOKEN,
+        'ADMIN_IDS': str(ADMIN_ID),
+        'DB_PATH': os.path.join(workdir, 'tournament.db'),
+        'ARCHIVE_PATH': os.path.join(workdir, 'archive.db'),
+        'SESSION_BACKEND': 'sqlite',
+    })
+    import bot as app
+
+    recorded = load_updates(args.updates) if args.updates else None
+    results = {}
+    try:
+        for number, mode in enumerate(('webhook', 'polling')):
+            if recorded is None:
+                # Each mode registers into its own tournament with its own users
+                tournament_id = await app.db.create_tournament(f"Replay {mode}", 64)
+                updates = synthetic_updates(app, tournament_id, 1000 * (number + 1), args.users)
+            else:
+                updates = [dict(update) for update in recorded]
+            for update_id, update in enumerate(updates, start=1):
+                update['update_id'] = update_id
+            results[mode] = await run_mode(app, mode, updates, args)
+    finally:
+        app.database.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay updates through webhook and polling mode")
+    parser.add_argument('--updates', help="JSON Lines file of recorded updates")
+    parser.add_argument('--users', type=int, default=60, help="users in the synthetic replay")
+    parser.add_argument('--rate', type=float, default=0, help="updates released per second, 0 for all at once")
+    parser.add_argument('--concurrency', type=int, default=8, help="updates handled at once")
+    parser.add_argument('--connections', type=int, default=40, help="concurrent webhook POSTs")
+    parser.add_argument('--timeout', type=float, default=120, help="seconds to wait for every update")
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run(args))
+    print(f"{'mode':<10}{'updates':>10}{'updates/sec':>14}{'p50 ms':>10}{'p95 ms':>10}{'api calls':>12}")
+    for mode, result in results.items():
+        print(
+            f"{mode:<10}{result['updates']:>10}{result['updates_per_sec']:>14.1f}"
+            f"{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}{result['api_calls']:>12}"
+        )
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,12 +1,44 @@
+import asyncio
 import logging
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ContextTypes
-import json
-from config import BOT_TOKEN, ADMIN_IDS, ALLOWED_TEAM_SIZES
-from database import Database
+from config import (
+    BOT_TOKEN, ADMIN_IDS, ALLOWED_TEAM_SIZES, TOURNAMENT_SIZES, BRACKET_LAYOUT, DB_PATH, PAGE_SIZE, SESSION_BACKEND, SESSION_TTL,
+    WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET, CONCURRENT_UPDATES,
+    METRICS_PORT, ARCHIVE_PATH, ARCHIVE_AFTER_DAYS, MAINTENANCE_INTERVAL
+)
+from cache import LRUCache
+from database import Database, AsyncDatabase
+from formats import FORMATS
+from live import LiveBrackets
+import metrics
+from notifications import NotificationDispatcher
+from router import CallbackRouter
+from sessions import RegistrationSession, create_session_store
+from sharding import ChatUpdateProcessor, KeyedLocks
+
+# Initialize database; calls run on a dedicated thread off the event loop
+database = Database(DB_PATH, page_size=PAGE_SIZE, archive_path=ARCHIVE_PATH)
+db = AsyncDatabase(database)
+
+# Registration and tournament creation progress, stored outside the bot so
+# it survives restarts and any process on the database can pick up a user's
+# next step. Saves are compare-and-swap, so concurrent steps don't
+# overwrite each other.
+sessions = AsyncDatabase(create_session_store(SESSION_BACKEND, database, SESSION_TTL), db.executor)
+
+# Rendered team cards by team id: (text, media group or None, captioned)
+team_cards = LRUCache(maxsize=512, ttl=600)
+
+# Album photos being collected: (user id, media_group_id) -> photos
+albums = {}
 
-# Initialize database
-db = Database()
+# Held by user id while photos are added to a registration. Albums are
+# stored from their own tasks, outside the per-chat update lock.
+photo_locks = KeyedLocks()
+
+# Admin notifications are sent in the background by the dispatcher
+notifier = NotificationDispatcher()
 
 # Enable logging
 logging.basicConfig(
@@ -14,28 +46,137 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Telegram's limits for a message and a photo caption
+MAX_MESSAGE_LENGTH = 4096
+MAX_CAPTION_LENGTH = 1024
+
+# Team photos needed to complete a registration
+PHOTOS_REQUIRED = 4
+
+# Seconds to wait for the rest of an album after its first photo
+ALBUM_WINDOW = 1.0
+
 # Registration states
 TEAM_NAME, TEAM_LEADER, TEAM_ROSTER, TEAM_PHOTOS = range(4)
 
-class TournamentBot:
-    def __init__(self):
-        self.user_data = {}
-        self.registration_data = {}
+# Tournament creation states. Creation shares the session store with
+# registration and keeps the name in tournament_name.
+TOURNAMENT_NAME, TOURNAMENT_SIZE = range(4, 6)
+
+# Reply to a step whose session another update saved first
+STALE_STEP = "⚠️ That step was already handled. Please continue from the latest message."
+
+# Inline button payloads, each routed to the TournamentBot method it names
+callbacks = CallbackRouter()
+callbacks.register('create_tournament_start', 'ct')
+callbacks.register('admin_panel', 'ap', 2, optional=2)
+callbacks.register('view_tournaments', 'vt', 2, optional=2)
+callbacks.register('my_teams', 'mt')
+callbacks.register('view_archive', 'va', 2, optional=2)
+callbacks.register('handle_tournament_size', 'sz', 1)
+callbacks.register('handle_tournament_format', 'fm', 2)
+callbacks.register('tournament_details', 't', 3, optional=2)
+callbacks.register('start_registration', 'r', 1)
+callbacks.register('show_team_details', 'vm', 1)
+callbacks.register('delete_tournament', 'dt', 1)
+callbacks.register('delete_team', 'dm', 1)
+callbacks.register('start_bracket', 'sb', 1)
+callbacks.register('show_current_matches', 'cm', 1)
+callbacks.register('show_bracket', 'b', 1)
+callbacks.register('set_match_winner', 'w', 2)
+callbacks.register('show_standings', 'sd', 1)
+
+def render_bracket(rounds):
+    text = "📈 Bracket\n"
+    for round_number, matches in rounds.items():
+        section = f"\nRound {round_number}\n"
+        for match in matches:
+            team_a = match.team_a_name or "TBD"
+            team_b = match.team_b_name or "TBD"
+            if match.status == "bye":
+                section += f"  {match.match_number}. {team_a} advances (bye)\n"
+            elif match.winner_id:
+                winner = team_a if match.winner_id == match.team_a_id else team_b
+                section += f"  {match.match_number}. {team_a} vs {team_b} → 🏆 {winner}\n"
+            else:
+                section += f"  {match.match_number}. {team_a} vs {team_b}\n"
+        # Long round robins don't fit in one message; later rounds are cut
+        if len(text) + len(section) > MAX_MESSAGE_LENGTH - 2:
+            return text + "\n…"
+        text += section
+    return text
+
+def render_standings(standings):
+    text = "📊 Standings\n\n"
+    for position, standing in enumerate(standings, start=1):
+        text += f"{position}. {standing.name} — {standing.wins}W {standing.losses}L (Buchholz {standing.buchholz})\n"
+    return text
+
+def render_leaderboard(rows, kind):
+    text = f"🏅 {'Player' if kind == 'player' else 'Team'} Leaderboard\n\n"
+    if not rows:
+        return text + "No results recorded yet."
+    for position, (name, rating, games, wins) in enumerate(rows, start=1):
+        text += f"{position}. {name} — {rating:.0f} ({wins}W {games - wins}L)\n"
+    return text
 
+def render_team_card(team):
+    roster = team[4]
+    photos = team[5]
+    
+    text = f"👥 Team Details\n\n"
+    text += f"🏷 Name: {team[2]}\n"
+    text += f"👑 Leader: @{team[3]}\n"
+    text += f"📊 Roster:\n"
+    for player in roster:
+        text += f"  • {player}\n"
+    text += f"📅 Registered: {team[6]}"
+    
+    if not photos:
+        return text, None, False
+    
+    # The card rides along as the album caption when it fits
+    captioned = len(text) <= MAX_CAPTION_LENGTH
+    media_group = [InputMediaPhoto(photos[0], caption=text if captioned else None)]
+    media_group += [InputMediaPhoto(photo) for photo in photos[1:4]]
+    return text, media_group, captioned
+
+def page_buttons(page, name, *args):
+    # Prev/next row for a keyset page; the cursors are the edge row ids
+    row = []
+    if page.has_prev:
+        row.append(InlineKeyboardButton("⬅️ Prev", callback_data=callbacks.encode(name, *args, 0, page.rows[0][0])))
+    if page.has_next:
+        row.append(InlineKeyboardButton("Next ➡️", callback_data=callbacks.encode(name, *args, page.rows[-1][0], 0)))
+    return [row] if row else []
+
+# Pinned bracket messages, edited in place as results come in
+live = LiveBrackets(db, render_bracket)
+
+async def send_page(query, text, reply_markup, paging):
+    # Turning a page edits the list in place instead of posting a new one
+    if paging:
+        await query.edit_message_text(text, reply_markup=reply_markup)
+    else:
+        await query.message.reply_text(text, reply_markup=reply_markup)
+
+class TournamentBot:
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_id = update.effective_user.id
         keyboard = []
         
         if user_id in ADMIN_IDS:
             keyboard = [
-                [InlineKeyboardButton("🏆 Create Tournament", callback_data="create_tournament")],
-                [InlineKeyboardButton("📊 Admin Panel", callback_data="admin_panel")],
-                [InlineKeyboardButton("🎯 View Tournaments", callback_data="view_tournaments")]
+                [InlineKeyboardButton("🏆 Create Tournament", callback_data=callbacks.encode("create_tournament_start"))],
+                [InlineKeyboardButton("📊 Admin Panel", callback_data=callbacks.encode("admin_panel"))],
+                [InlineKeyboardButton("🎯 View Tournaments", callback_data=callbacks.encode("view_tournaments"))],
+                [InlineKeyboardButton("📜 Past Tournaments", callback_data=callbacks.encode("view_archive"))]
             ]
         else:
             keyboard = [
-                [InlineKeyboardButton("🎯 View Tournaments", callback_data="view_tournaments")],
-                [InlineKeyboardButton("📋 My Teams", callback_data="my_teams")]
+                [InlineKeyboardButton("🎯 View Tournaments", callback_data=callbacks.encode("view_tournaments"))],
+                [InlineKeyboardButton("📋 My Teams", callback_data=callbacks.encode("my_teams"))],
+                [InlineKeyboardButton("📜 Past Tournaments", callback_data=callbacks.encode("view_archive"))]
             ]
         
         reply_markup = InlineKeyboardMarkup(keyboard)
@@ -45,61 +186,69 @@ class TournamentBot:
             reply_markup=reply_markup
         )
 
+    async def leaderboard(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        # /leaderboard for teams, /leaderboard players for players
+        kind = 'player' if context.args and context.args[0].lower().startswith('player') else 'team'
+        rows = await db.get_leaderboard(kind)
+        await update.message.reply_text(render_leaderboard(rows, kind))
+
+    async def search(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        # /search <words> finds teams by name, leader or player, matching
+        # the start of each word
+        text = " ".join(context.args or [])
+        if not text:
+            await update.message.reply_text("🔎 Usage: /search <team, leader or player>")
+            return
+        
+        results = await db.search_teams(text)
+        if not results:
+            await update.message.reply_text(f"🔎 No teams found for \"{text}\".")
+            return
+        
+        text = f"🔎 Results for \"{text}\"\n\n"
+        keyboard = []
+        for result in results:
+            if result.archived:
+                text += f"• {result.name} (@{result.leader_username}) — {result.tournament_name} 📜\n"
+            else:
+                text += f"• {result.name} (@{result.leader_username}) — {result.tournament_name}\n"
+                keyboard.append([
+                    InlineKeyboardButton(f"View {result.name}", callback_data=callbacks.encode("show_team_details", result.team_id))
+                ])
+        
+        await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard) if keyboard else None)
+
     async def button_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         query = update.callback_query
         await query.answer()
         
-        data = query.data
-        user_id = query.from_user.id
+        decoded = callbacks.decode(query.data)
+        if decoded is None:
+            await query.message.reply_text("⚠️ This button has expired. Please send /start again.")
+            return
         
-        if data == "create_tournament":
-            await self.create_tournament_start(query, context)
-        elif data == "admin_panel":
-            await self.admin_panel(query, context)
-        elif data == "view_tournaments":
-            await self.view_tournaments(query, context)
-        elif data.startswith("tournament_"):
-            tournament_id = int(data.split("_")[1])
-            await self.tournament_details(query, context, tournament_id)
-        elif data.startswith("register_"):
-            tournament_id = int(data.split("_")[1])
-            await self.start_registration(query, context, tournament_id)
-        elif data.startswith("view_team_"):
-            team_id = int(data.split("_")[2])
-            await self.show_team_details(query, context, team_id)
-        elif data.startswith("delete_tournament_"):
-            tournament_id = int(data.split("_")[2])
-            await self.delete_tournament(query, context, tournament_id)
-        elif data.startswith("delete_team_"):
-            team_id = int(data.split("_")[2])
-            await self.delete_team(query, context, team_id)
-        elif data.startswith("start_bracket_"):
-            tournament_id = int(data.split("_")[2])
-            await self.start_bracket(query, context, tournament_id)
-        elif data.startswith("match_"):
-            match_data = data.split("_")
-            match_id = int(match_data[1])
-            team_id = int(match_data[2])
-            await self.set_match_winner(query, context, match_id, team_id)
+        route, args = decoded
+        await getattr(self, route.name)(query, context, *args)
 
     async def create_tournament_start(self, query, context):
         if query.from_user.id not in ADMIN_IDS:
             await query.message.reply_text("❌ Only admins can create tournaments.")
             return
         
-        context.user_data['creating_tournament'] = True
+        await sessions.save(RegistrationSession(query.from_user.id, None, TOURNAMENT_NAME))
         await query.message.reply_text("🏆 Let's create a tournament!\n\nPlease enter the tournament name:")
 
-    async def handle_tournament_name(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        if not context.user_data.get('creating_tournament'):
-            return
-        
+    async def handle_tournament_name(self, update: Update, context: ContextTypes.DEFAULT_TYPE, session):
         tournament_name = update.message.text
-        context.user_data['tournament_name'] = tournament_name
+        session.tournament_name = tournament_name
+        session.step = TOURNAMENT_SIZE
+        if not await sessions.save(session):
+            await update.message.reply_text(STALE_STEP)
+            return
         
         keyboard = []
-        for size in [8, 16, 32, 64]:
-            keyboard.append([InlineKeyboardButton(f"{size} Teams", callback_data=f"size_{size}")])
+        for size in TOURNAMENT_SIZES:
+            keyboard.append([InlineKeyboardButton(f"{size} Teams", callback_data=callbacks.encode("handle_tournament_size", size))])
         
         reply_markup = InlineKeyboardMarkup(keyboard)
         await update.message.reply_text(
@@ -107,124 +256,184 @@ class TournamentBot:
             reply_markup=reply_markup
         )
 
-    async def handle_tournament_size(self, query, context):
-        size = int(query.data.split("_")[1])
-        tournament_name = context.user_data.get('tournament_name')
+    async def handle_tournament_size(self, query, context, size):
+        if query.from_user.id not in ADMIN_IDS or size not in TOURNAMENT_SIZES:
+            return
+        
+        keyboard = []
+        for number, label in enumerate(FORMATS.values()):
+            keyboard.append([InlineKeyboardButton(label, callback_data=callbacks.encode("handle_tournament_format", size, number))])
+        
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        await query.message.reply_text(f"🎯 {size} teams\n\nSelect the format:", reply_markup=reply_markup)
+
+    async def handle_tournament_format(self, query, context, size, format_number):
+        if query.from_user.id not in ADMIN_IDS or size not in TOURNAMENT_SIZES or format_number >= len(FORMATS):
+            return
+        
+        # Clearing the creation state claims it, so a second tap (here or
+        # in another process) can't create the tournament twice
+        session = await sessions.get(query.from_user.id)
+        if not session or session.step != TOURNAMENT_SIZE or not await sessions.delete(session.user_id, session.version):
+            await query.message.reply_text("❌ Tournament creation expired. Please start again from the admin panel.")
+            return
         
-        tournament_id = db.create_tournament(tournament_name, size)
+        tournament_name = session.tournament_name
+        bracket_format = list(FORMATS)[format_number]
+        tournament_id = await db.create_tournament(tournament_name, size, bracket_format)
         
         # Notify all admins
-        for admin_id in ADMIN_IDS:
-            try:
-                await context.bot.send_message(
-                    admin_id,
-                    f"🏆 New Tournament Created!\n\n"
-                    f"Name: {tournament_name}\n"
-                    f"Size: {size} teams\n"
-                    f"ID: {tournament_id}"
-                )
-            except Exception as e:
-                logger.error(f"Failed to notify admin {admin_id}: {e}")
+        notifier.send_message(
+            ADMIN_IDS,
+            f"🏆 New Tournament Created!\n\n"
+            f"Name: {tournament_name}\n"
+            f"Size: {size} teams\n"
+            f"Format: {FORMATS[bracket_format]}\n"
+            f"ID: {tournament_id}"
+        )
         
         await query.message.reply_text(
             f"✅ Tournament '{tournament_name}' created successfully!\n"
-            f"Max teams: {size}\n\n"
+            f"Max teams: {size}\n"
+            f"Format: {FORMATS[bracket_format]}\n\n"
             f"Players can now register using the 'View Tournaments' option."
         )
-        
-        # Clear creation state
-        context.user_data.pop('creating_tournament', None)
-        context.user_data.pop('tournament_name', None)
 
-    async def admin_panel(self, query, context):
+    async def admin_panel(self, query, context, after_id=0, before_id=0):
         if query.from_user.id not in ADMIN_IDS:
             await query.message.reply_text("❌ Only admins can access this panel.")
             return
         
-        tournaments = db.get_active_tournaments()
+        page = await db.get_active_tournaments(after_id, before_id)
+        paging = bool(after_id or before_id)
         
-        if not tournaments:
+        if not page.rows:
+            if paging:
+                await self.admin_panel(query, context)
+                return
             await query.message.reply_text("📊 Admin Panel\n\nNo active tournaments.")
             return
         
         text = "📊 Admin Panel\n\nActive Tournaments:\n"
         keyboard = []
         
-        for tournament in tournaments:
+        for tournament in page.rows:
             text += f"\n🏆 {tournament[1]} (ID: {tournament[0]})\n"
             text += f"   Teams: {tournament[3]}/{tournament[2]}\n"
             text += f"   Status: {tournament[4]}\n"
             
             keyboard.append([
-                InlineKeyboardButton(f"Manage {tournament[1]}", callback_data=f"tournament_{tournament[0]}")
+                InlineKeyboardButton(f"Manage {tournament[1]}", callback_data=callbacks.encode("tournament_details", tournament[0]))
             ])
+        keyboard += page_buttons(page, "admin_panel")
         
         reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.message.reply_text(text, reply_markup=reply_markup)
+        await send_page(query, text, reply_markup, paging)
 
-    async def view_tournaments(self, query, context):
-        tournaments = db.get_active_tournaments()
-        
-        if not tournaments:
+    async def view_tournaments(self, query, context, after_id=0, before_id=0):
+        page = await db.get_active_tournaments(after_id, before_id)
+        paging = bool(after_id or before_id)
+        
+        if not page.rows:
+            if paging:
+                await self.view_tournaments(query, context)
+                return
             await query.message.reply_text("🎯 No active tournaments available for registration.")
             return
         
         text = "🎯 Active Tournaments:\n\n"
         keyboard = []
         
-        for tournament in tournaments:
+        for tournament in page.rows:
             text += f"🏆 {tournament[1]}\n"
             text += f"📊 {tournament[3]}/{tournament[2]} teams registered\n"
             text += f"🆔 ID: {tournament[0]}\n\n"
             
             if tournament[3] < tournament[2]:  # If not full
                 keyboard.append([
-                    InlineKeyboardButton(f"Register for {tournament[1]}", callback_data=f"register_{tournament[0]}")
+                    InlineKeyboardButton(f"Register for {tournament[1]}", callback_data=callbacks.encode("start_registration", tournament[0]))
                 ])
             keyboard.append([
-                InlineKeyboardButton(f"View Teams in {tournament[1]}", callback_data=f"tournament_{tournament[0]}")
+                InlineKeyboardButton(f"View Teams in {tournament[1]}", callback_data=callbacks.encode("tournament_details", tournament[0]))
             ])
+        keyboard += page_buttons(page, "view_tournaments")
         
         reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.message.reply_text(text, reply_markup=reply_markup)
+        await send_page(query, text, reply_markup, paging)
 
-    async def tournament_details(self, query, context, tournament_id):
-        tournament = db.get_tournament(tournament_id)
+    async def view_archive(self, query, context, after_id=0, before_id=0):
+        page = await db.get_archived_tournaments(after_id, before_id)
+        paging = bool(after_id or before_id)
+        
+        if not page.rows:
+            if paging:
+                await self.view_archive(query, context)
+                return
+            await query.message.reply_text("📜 No past tournaments yet.")
+            return
+        
+        text = "📜 Past Tournaments:\n\n"
+        for tournament in page.rows:
+            text += f"🏆 {tournament[1]}\n"
+            text += f"👑 Champion: {tournament[4] or 'unknown'}\n"
+            text += f"📊 {tournament[2]} teams, finished {tournament[3][:10]}\n\n"
+        
+        reply_markup = InlineKeyboardMarkup(page_buttons(page, "view_archive"))
+        await send_page(query, text, reply_markup, paging)
+
+    async def tournament_details(self, query, context, tournament_id, after_id=0, before_id=0):
+        tournament = await db.get_tournament(tournament_id)
         if not tournament:
             await query.message.reply_text("❌ Tournament not found.")
             return
         
-        teams = db.get_tournament_teams(tournament_id)
+        page = await db.get_tournament_teams(tournament_id, after_id, before_id)
+        paging = bool(after_id or before_id)
+        if paging and not page.rows:
+            page = await db.get_tournament_teams(tournament_id)
         user_id = query.from_user.id
         
         text = f"🏆 {tournament[1]}\n"
         text += f"📊 Teams: {tournament[3]}/{tournament[2]}\n"
+        text += f"🎲 Format: {FORMATS.get(tournament[9], tournament[9])}\n"
         text += f"📝 Status: {tournament[4]}\n\n"
         text += "Registered Teams:\n"
         
         keyboard = []
         
-        for team in teams:
+        for team in page.rows:
             text += f"• {team[2]} (Leader: @{team[3]})\n"
             keyboard.append([
-                InlineKeyboardButton(f"View {team[2]}", callback_data=f"view_team_{team[0]}")
+                InlineKeyboardButton(f"View {team[2]}", callback_data=callbacks.encode("show_team_details", team[0]))
+            ])
+        keyboard += page_buttons(page, "tournament_details", tournament_id)
+        
+        if tournament[4] != "registration":
+            keyboard.append([
+                InlineKeyboardButton("📈 View Bracket", callback_data=callbacks.encode("show_bracket", tournament_id)),
+                InlineKeyboardButton("📊 Standings", callback_data=callbacks.encode("show_standings", tournament_id))
             ])
         
         # Admin controls
         if user_id in ADMIN_IDS:
-            if tournament[4] == "registration" and tournament[3] == tournament[2]:
+            # Any field of two or more teams can be bracketed; byes fill the gaps
+            if tournament[4] == "registration" and tournament[3] >= 2:
+                keyboard.append([
+                    InlineKeyboardButton("🚀 Start Bracket", callback_data=callbacks.encode("start_bracket", tournament_id))
+                ])
+            elif tournament[4] == "ongoing":
                 keyboard.append([
-                    InlineKeyboardButton("🚀 Start Bracket", callback_data=f"start_bracket_{tournament_id}")
+                    InlineKeyboardButton("🎯 Current Matches", callback_data=callbacks.encode("show_current_matches", tournament_id))
                 ])
             keyboard.append([
-                InlineKeyboardButton("🗑 Delete Tournament", callback_data=f"delete_tournament_{tournament_id}")
+                InlineKeyboardButton("🗑 Delete Tournament", callback_data=callbacks.encode("delete_tournament", tournament_id))
             ])
         
         reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.message.reply_text(text, reply_markup=reply_markup)
+        await send_page(query, text, reply_markup, paging)
 
     async def start_registration(self, query, context, tournament_id):
-        tournament = db.get_tournament(tournament_id)
+        tournament = await db.get_tournament(tournament_id)
         if not tournament:
             await query.message.reply_text("❌ Tournament not found.")
             return
@@ -233,40 +442,48 @@ class TournamentBot:
             await query.message.reply_text("❌ Tournament is full. Registration closed.")
             return
         
-        self.registration_data[query.from_user.id] = {
-            'tournament_id': tournament_id,
-            'step': TEAM_NAME
-        }
+        await sessions.save(RegistrationSession(query.from_user.id, tournament_id, TEAM_NAME))
         
         await query.message.reply_text(
             f"🎯 Registration for {tournament[1]}\n\n"
             "Step 1/4: Please enter your team name:"
         )
 
-    async def handle_team_name(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        user_id = update.effective_user.id
-        if user_id not in self.registration_data:
+    async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        session = await sessions.get(update.effective_user.id)
+        
+        if session:
+            if session.step == TEAM_NAME:
+                await self.handle_team_name(update, context, session)
+            elif session.step == TEAM_LEADER:
+                await self.handle_team_leader(update, context, session)
+            elif session.step == TEAM_ROSTER:
+                await self.handle_team_roster(update, context, session)
+            elif session.step == TEAM_PHOTOS:
+                await update.message.reply_text("❌ Please send photos only.")
+            elif session.step == TOURNAMENT_NAME:
+                await self.handle_tournament_name(update, context, session)
+
+    async def handle_team_name(self, update: Update, context: ContextTypes.DEFAULT_TYPE, session):
+        session.team_name = update.message.text
+        session.step = TEAM_LEADER
+        if not await sessions.save(session):
+            await update.message.reply_text(STALE_STEP)
             return
         
-        team_name = update.message.text
-        self.registration_data[user_id]['team_name'] = team_name
-        self.registration_data[user_id]['step'] = TEAM_LEADER
-        
         await update.message.reply_text(
             "✅ Team name saved!\n\n"
             "Step 2/4: Please enter team leader's username (without @):"
         )
 
-    async def handle_team_leader(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        user_id = update.effective_user.id
-        if user_id not in self.registration_data:
+    async def handle_team_leader(self, update: Update, context: ContextTypes.DEFAULT_TYPE, session):
+        session.leader_username = update.message.text
+        session.step = TEAM_ROSTER
+        session.roster = []
+        if not await sessions.save(session):
+            await update.message.reply_text(STALE_STEP)
             return
         
-        leader_username = update.message.text
-        self.registration_data[user_id]['leader_username'] = leader_username
-        self.registration_data[user_id]['step'] = TEAM_ROSTER
-        self.registration_data[user_id]['roster'] = []
-        
         await update.message.reply_text(
             "✅ Leader username saved!\n\n"
             "Step 3/4: Please enter team roster (3-4 usernames, one per line):\n"
@@ -276,11 +493,7 @@ class TournamentBot:
             "player3"
         )
 
-    async def handle_team_roster(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        user_id = update.effective_user.id
-        if user_id not in self.registration_data:
-            return
-        
+    async def handle_team_roster(self, update: Update, context: ContextTypes.DEFAULT_TYPE, session):
         roster_text = update.message.text
         roster = [line.strip() for line in roster_text.split('\n') if line.strip()]
         
@@ -290,114 +503,165 @@ class TournamentBot:
             )
             return
         
-        self.registration_data[user_id]['roster'] = roster
-        self.registration_data[user_id]['step'] = TEAM_PHOTOS
-        self.registration_data[user_id]['photos'] = []
+        session.roster = roster
+        session.step = TEAM_PHOTOS
+        session.photos = []
+        session.photo_keys = []
+        if not await sessions.save(session):
+            await update.message.reply_text(STALE_STEP)
+            return
         
         await update.message.reply_text(
             "✅ Roster saved!\n\n"
-            "Step 4/4: Please send 3-4 photos of your team (send them one by one):"
+            f"Step 4/4: Please send {PHOTOS_REQUIRED} photos of your team, one by one or as an album:"
         )
 
     async def handle_team_photos(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        user_id = update.effective_user.id
-        if user_id not in self.registration_data or self.registration_data[user_id]['step'] != TEAM_PHOTOS:
+        message = update.message
+        photo = message.photo[-1]
+        if message.media_group_id is None:
+            await self.add_team_photos(message, update.effective_user.id, [photo])
             return
         
-        if not update.message.photo:
-            await update.message.reply_text("❌ Please send photos only.")
+        # An album arrives as one update per photo. The first opens a short
+        # collection window and the rest join it, so the album is stored
+        # and acknowledged once.
+        key = (update.effective_user.id, message.media_group_id)
+        if key in albums:
+            albums[key].append(photo)
             return
+        albums[key] = [photo]
+        context.application.create_task(self.collect_album(key, message), update=update)
+
+    async def collect_album(self, key, message):
+        await asyncio.sleep(ALBUM_WINDOW)
+        await self.add_team_photos(message, key[0], albums.pop(key))
+
+    async def add_team_photos(self, message, user_id, photos):
+        # One batch of photos at a time per user; an album and a single
+        # photo, or two albums, would otherwise read the same session
+        async with photo_locks.hold(user_id):
+            await self.store_team_photos(message, user_id, photos)
+
+    async def store_team_photos(self, message, user_id, photos):
+        # Another process can save the session between our read and save;
+        # the save then fails and the photos are added again to the session
+        # as it is now
+        while True:
+            session = await sessions.get(user_id)
+            if not session or session.step != TEAM_PHOTOS:
+                return
+            
+            # The same picture sent twice has a new file_id but the same
+            # file_unique_id
+            added = 0
+            for photo in photos:
+                if len(session.photos) == PHOTOS_REQUIRED:
+                    break
+                if photo.file_unique_id not in session.photo_keys:
+                    session.photos.append(photo.file_id)
+                    session.photo_keys.append(photo.file_unique_id)
+                    added += 1
+            skipped = len(photos) - added
+            
+            remaining = PHOTOS_REQUIRED - len(session.photos)
+            if remaining > 0:
+                if not await sessions.save(session):
+                    continue
+                text = f"✅ {added} photo(s) received ({len(session.photos)}/{PHOTOS_REQUIRED}). Send {remaining} more."
+                if skipped:
+                    text += f"\n⚠️ Skipped {skipped} duplicate photo(s)."
+                await message.reply_text(text)
+                return
+            
+            # The last photo clears the session, claiming it, so only one
+            # update registers the team
+            if await sessions.delete(user_id, session.version):
+                await self.complete_registration(message, session)
+                return
+
+    async def complete_registration(self, message, session):
+        success, error, is_full = await db.register_team(
+            session.tournament_id,
+            session.team_name,
+            session.leader_username,
+            session.roster,
+            session.photos
+        )
         
-        photo_file_id = update.message.photo[-1].file_id
-        self.registration_data[user_id]['photos'].append(photo_file_id)
-        
-        current_count = len(self.registration_data[user_id]['photos'])
-        remaining = 4 - current_count
-        
-        if remaining > 0:
-            await update.message.reply_text(f"✅ Photo {current_count}/4 received. Send {remaining} more photos.")
-        else:
-            # Registration complete
-            data = self.registration_data[user_id]
-            success, message, is_full = db.register_team(
-                data['tournament_id'],
-                data['team_name'],
-                data['leader_username'],
-                data['roster'],
-                data['photos']
+        if success:
+            tournament = await db.get_tournament(session.tournament_id)
+            
+            # Notify admins; a burst of signups is merged into one digest
+            media_group = [InputMediaPhoto(photo) for photo in session.photos[:2]]  # Send first 2 photos with a lone signup
+            notifier.send_digest(
+                ADMIN_IDS,
+                'registrations',
+                f"🎉 New Team Registered!\n\n"
+                f"🏆 Tournament: {tournament[1]}\n"
+                f"👥 Team: {session.team_name}\n"
+                f"👑 Leader: @{session.leader_username}\n"
+                f"📊 Roster: {', '.join(session.roster)}\n"
+                f"📈 Progress: {tournament[3]}/{tournament[2]} teams",
+                media_group
             )
             
-            if success:
-                tournament = db.get_tournament(data['tournament_id'])
-                
-                # Notify admins
-                for admin_id in ADMIN_IDS:
-                    try:
-                        await context.bot.send_message(
-                            admin_id,
-                            f"🎉 New Team Registered!\n\n"
-                            f"🏆 Tournament: {tournament[1]}\n"
-                            f"👥 Team: {data['team_name']}\n"
-                            f"👑 Leader: @{data['leader_username']}\n"
-                            f"📊 Roster: {', '.join(data['roster'])}\n"
-                            f"📈 Progress: {tournament[3]}/{tournament[2]} teams"
-                        )
-                        
-                        # Send photos to admin
-                        media_group = [InputMediaPhoto(photo) for photo in data['photos'][:2]]  # Send first 2 photos
-                        await context.bot.send_media_group(admin_id, media_group)
-                        
-                    except Exception as e:
-                        logger.error(f"Failed to notify admin {admin_id}: {e}")
-                
-                await update.message.reply_text(
-                    f"✅ Registration successful!\n\n"
-                    f"Team: {data['team_name']}\n"
-                    f"Leader: @{data['leader_username']}\n"
-                    f"Roster: {', '.join(data['roster'])}\n\n"
-                    f"You are now registered for the tournament!"
-                )
-                
-                if is_full:
-                    for admin_id in ADMIN_IDS:
-                        try:
-                            await context.bot.send_message(
-                                admin_id,
-                                f"🎊 Tournament '{tournament[1]}' is now FULL!\n"
-                                f"All {tournament[2]} teams have registered.\n"
-                                f"Use the admin panel to start the bracket."
-                            )
-                        except Exception as e:
-                            logger.error(f"Failed to notify admin {admin_id}: {e}")
-            else:
-                await update.message.reply_text(f"❌ Registration failed: {message}")
+            await message.reply_text(
+                f"✅ Registration successful!\n\n"
+                f"Team: {session.team_name}\n"
+                f"Leader: @{session.leader_username}\n"
+                f"Roster: {', '.join(session.roster)}\n\n"
+                f"You are now registered for the tournament!"
+            )
             
-            # Clear registration data
-            self.registration_data.pop(user_id, None)
+            if is_full:
+                notifier.send_message(
+                    ADMIN_IDS,
+                    f"🎊 Tournament '{tournament[1]}' is now FULL!\n"
+                    f"All {tournament[2]} teams have registered.\n"
+                    f"Use the admin panel to start the bracket."
+                )
+        else:
+            await message.reply_text(f"❌ Registration failed: {error}")
 
-    async def show_team_details(self, query, context, team_id):
-        team = db.get_team_details(team_id)
-        if not team:
-            await query.message.reply_text("❌ Team not found.")
+    async def my_teams(self, query, context):
+        username = query.from_user.username
+        if not username:
+            await query.message.reply_text("❌ Set a Telegram username to see the teams you play in.")
             return
         
-        roster = json.loads(team[4])
-        photos = json.loads(team[5])
+        teams = await db.get_user_teams(username)
+        if not teams:
+            await query.message.reply_text("📋 You are not on any team yet.")
+            return
         
-        text = f"👥 Team Details\n\n"
-        text += f"🏷 Name: {team[2]}\n"
-        text += f"👑 Leader: @{team[3]}\n"
-        text += f"📊 Roster:\n"
-        for player in roster:
-            text += f"  • {player}\n"
-        text += f"📅 Registered: {team[6]}"
+        text = "📋 My Teams\n\n"
+        keyboard = []
         
-        # Send team info
-        await query.message.reply_text(text)
+        for team in teams:
+            role = "👑 Leader" if team[3].lower() == username.lower() else "🎮 Player"
+            text += f"• {team[2]} — {team[4]} ({team[5]}) {role}\n"
+            keyboard.append([
+                InlineKeyboardButton(f"View {team[2]}", callback_data=callbacks.encode("show_team_details", team[0]))
+            ])
         
-        # Send team photos
-        if photos:
-            media_group = [InputMediaPhoto(photo) for photo in photos[:4]]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        await query.message.reply_text(text, reply_markup=reply_markup)
+
+    async def show_team_details(self, query, context, team_id):
+        card = team_cards.get(team_id)
+        if card is None:
+            team = await db.get_team_details(team_id)
+            if not team:
+                await query.message.reply_text("❌ Team not found.")
+                return
+            card = render_team_card(team)
+            team_cards.set(team_id, card)
+        
+        text, media_group, captioned = card
+        if not captioned:
+            await query.message.reply_text(text)
+        if media_group:
             await context.bot.send_media_group(query.message.chat_id, media_group)
 
     async def delete_tournament(self, query, context, tournament_id):
@@ -405,7 +669,8 @@ class TournamentBot:
             await query.message.reply_text("❌ Only admins can delete tournaments.")
             return
         
-        db.delete_tournament(tournament_id)
+        await db.delete_tournament(tournament_id)
+        team_cards.clear()
         await query.message.reply_text("✅ Tournament deleted successfully.")
 
     async def delete_team(self, query, context, team_id):
@@ -413,7 +678,8 @@ class TournamentBot:
             await query.message.reply_text("❌ Only admins can delete teams.")
             return
         
-        db.delete_team(team_id)
+        await db.delete_team(team_id)
+        team_cards.invalidate(team_id)
         await query.message.reply_text("✅ Team deleted successfully.")
 
     async def start_bracket(self, query, context, tournament_id):
@@ -421,11 +687,21 @@ class TournamentBot:
             await query.message.reply_text("❌ Only admins can start brackets.")
             return
         
-        db.create_bracket(tournament_id)
+        if not await db.create_bracket(tournament_id, BRACKET_LAYOUT):
+            await query.message.reply_text("❌ This bracket has already been started.")
+            return
         await self.show_current_matches(query, context, tournament_id)
 
-    async def show_current_matches(self, query, context, tournament_id, round_number=1):
-        matches = db.get_current_matches(tournament_id, round_number)
+    async def show_current_matches(self, query, context, tournament_id, edit=False):
+        rounds = await db.get_bracket(tournament_id)
+        
+        # The earliest round that still has matches to play
+        round_number, matches = None, []
+        for number, round_matches in rounds.items():
+            matches = [match for match in round_matches if match.status == 'pending']
+            if matches:
+                round_number = number
+                break
         
         if not matches:
             await query.message.reply_text("No current matches available.")
@@ -435,61 +711,144 @@ class TournamentBot:
         keyboard = []
         
         for match in matches:
-            team_a = db.get_team_details(match[4])
-            team_b = db.get_team_details(match[5])
-            
-            text += f"Match {match[3]}:\n"
-            text += f"  {team_a[2]} vs {team_b[2]}\n\n"
+            text += f"Match {match.match_number}:\n"
+            text += f"  {match.team_a_name} vs {match.team_b_name}\n\n"
             
             keyboard.append([
-                InlineKeyboardButton(f"🏆 {team_a[2]} wins", callback_data=f"match_{match[0]}_{team_a[0]}"),
-                InlineKeyboardButton(f"🏆 {team_b[2]} wins", callback_data=f"match_{match[0]}_{team_b[0]}")
+                InlineKeyboardButton(f"🏆 {match.team_a_name} wins", callback_data=callbacks.encode("set_match_winner", match.id, match.team_a_id)),
+                InlineKeyboardButton(f"🏆 {match.team_b_name} wins", callback_data=callbacks.encode("set_match_winner", match.id, match.team_b_id))
             ])
         
         reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.message.reply_text(text, reply_markup=reply_markup)
+        await send_page(query, text, reply_markup, edit)
+
+    async def show_bracket(self, query, context, tournament_id):
+        # The first view posts a live bracket and pins it; later views bring
+        # that message up to date and point back to it, or post and pin a
+        # new one if it has been deleted
+        rounds = await db.get_bracket(tournament_id)
+        if not rounds:
+            await query.message.reply_text("The bracket has not started yet.")
+            return
+        
+        text = render_bracket(rounds)
+        chat_id = query.message.chat_id
+        message_id = await db.get_bracket_subscription(tournament_id, chat_id)
+        if message_id and await live.show(tournament_id, chat_id, message_id, text):
+            await query.message.reply_text(
+                "📌 The live bracket is pinned in this chat and updates as results come in.",
+                reply_to_message_id=message_id,
+                allow_sending_without_reply=True
+            )
+            return
+        
+        message = await query.message.reply_text(text)
+        await live.follow(tournament_id, message, text)
+
+    async def show_standings(self, query, context, tournament_id):
+        standings = await db.get_standings(tournament_id)
+        if not standings:
+            await query.message.reply_text("The tournament has not started yet.")
+            return
+        
+        await query.message.reply_text(render_standings(standings))
 
     async def set_match_winner(self, query, context, match_id, winner_id):
         if query.from_user.id not in ADMIN_IDS:
             await query.message.reply_text("❌ Only admins can set match winners.")
             return
         
-        db.set_match_winner(match_id, winner_id)
+        result = await db.set_match_winner(match_id, winner_id)
+        if result is None:
+            await query.message.reply_text("❌ This match is not open for results.")
+            return
         
-        # Get match details to find tournament and round
-        # This would need additional database methods to properly handle bracket progression
+        tournament_id, champion_id = result
+        live.schedule(tournament_id)
         
-        await query.message.reply_text("✅ Match result recorded!")
+        # The match list is updated in place rather than posted again
+        if champion_id:
+            champion = await db.get_team_details(champion_id)
+            await query.edit_message_text(f"🏆 {champion[2]} wins the tournament!")
+        else:
+            await self.show_current_matches(query, context, tournament_id, edit=True)
 
-def main():
-    bot = TournamentBot()
-    
-    # Create application
-    application = Application.builder().token(BOT_TOKEN).build()
+async def post_init(application):
+    notifier.start(application.bot)
+    live.start(application.bot)
+
+async def post_stop(application):
+    # Runs once updates have stopped but before the bot's HTTP client is
+    # closed, so pending live edits and queued notifications can still go out
+    await live.stop()
+    await notifier.stop()
+
+async def maintain_database(context):
+    # Job queue callback: archive finished tournaments, then hand the pages
+    # they freed back to the file system so the hot database stays small
+    archived = await db.archive_completed(ARCHIVE_AFTER_DAYS)
+    released = await db.incremental_vacuum()
+    if archived or released:
+        logger.info(f"Archived {archived} tournaments, released {released} pages")
+
+def enable_metrics(bot, builder):
+    sink = metrics.PrometheusSink()
+    metrics.set_sink(sink)
+    sink.register_gauge('cache_hits_total', lambda: database.cache.hits)
+    sink.register_gauge('cache_misses_total', lambda: database.cache.misses)
+    # The connection is opened at import, before the sink exists, so the
+    # count is kept on the Database and read at scrape time
+    sink.register_gauge('db_connections_opened_total', lambda: database.connections_opened)
     
-    # Add handlers
+    metrics.instrument(bot, 'handler', 'handler')
+    metrics.instrument(database, 'db', 'method', skip=('connect', 'cursor', 'close', 'init_db', 'migrate', 'fetch_page', 'invalidate_tournament', 'insert_matches', 'fetch_standings', 'apply_standings', 'apply_ratings'))
+    # A request passed to the builder replaces its default one, so keep
+    # the default's pool of 256 connections; HTTPXRequest alone has one
+    builder.request(metrics.InstrumentedRequest(connection_pool_size=256))
+    metrics.serve(sink, METRICS_PORT)
+
+def add_handlers(application, bot):
     application.add_handler(CommandHandler("start", bot.start))
+    application.add_handler(CommandHandler("leaderboard", bot.leaderboard))
+    application.add_handler(CommandHandler("search", bot.search))
     application.add_handler(CallbackQueryHandler(bot.button_handler))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, bot.handle_message))
-    
-    # Start the bot
-    application.run_polling()
+    application.add_handler(MessageHandler(filters.PHOTO, bot.handle_team_photos))
 
-async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.effective_user.id
+def main():
     bot = TournamentBot()
     
-    if user_id in bot.registration_data:
-        step = bot.registration_data[user_id]['step']
-        
-        if step == TEAM_NAME:
-            await bot.handle_team_name(update, context)
-        elif step == TEAM_LEADER:
-            await bot.handle_team_leader(update, context)
-        elif step == TEAM_ROSTER:
-            await bot.handle_team_roster(update, context)
-    elif context.user_data.get('creating_tournament'):
-        await bot.handle_tournament_name(update, context)
+    # Create application
+    builder = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .concurrent_updates(ChatUpdateProcessor(CONCURRENT_UPDATES))
+        .post_init(post_init)
+        .post_stop(post_stop)
+    )
+    if METRICS_PORT:
+        enable_metrics(bot, builder)
+    application = builder.build()
+    add_handlers(application, bot)
+    
+    # Background maintenance needs the job-queue extra
+    if application.job_queue:
+        application.job_queue.run_repeating(maintain_database, interval=MAINTENANCE_INTERVAL, first=MAINTENANCE_INTERVAL)
+    else:
+        logger.warning("JobQueue unavailable; install python-telegram-bot[job-queue] to archive tournaments")
+    
+    # Start the bot. In webhook mode Telegram pushes updates to the built-in
+    # server, which rejects requests without the secret token header.
+    if WEBHOOK_URL:
+        application.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}"
+        )
+    else:
+        application.run_polling()
 
 if __name__ == '__main__':
     main()
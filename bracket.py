@@ -0,0 +1,173 @@
+# Bracket engine. A bracket is a plain dict; the database keeps its
+# matches as rows of the matches table and the rest as JSON in
+# tournaments.bracket_data:
+#
+#   {
+#       'format': 'single_elimination',
+#       'layout': 'standard',
+#       'seed': None,
+#       'rounds': 3,
+#       'offsets': [0, 4, 6],   # index of each round's first match
+#       'matches': [{'id', 'round', 'number', 'teams', 'winner', 'next'}, ...],
+#       'champion': None,
+#   }
+#
+# 'teams' holds two slots, each a team id, None (not decided yet) or BYE.
+# 'next' is [match_index, slot] the winner moves into, or None for the final.
+# Double elimination matches may also have 'loser_next', where the loser
+# drops into the losers bracket. Other formats are built in formats.py on
+# the same structure.
+# Recording a result only touches the match and the one it feeds, so
+# progression is O(1) per result.
+
+import functools
+import random
+from config import TOURNAMENT_SIZES
+
+# Slot value for an empty position; team ids start at 1
+BYE = 0
+
+# Formats decided by a final rather than by standings
+ELIMINATION_FORMATS = ('single_elimination', 'double_elimination')
+
+# Round-one layouts. team_ids passed to build_single_elimination are in
+# seed order (seed 1 first).
+#   standard  classic seeding: 1 v N, and seeds 1 and 2 can only meet in
+#             the final; byes go to the top seeds
+#   random    teams drawn by a seeded shuffle, then placed like standard,
+#             so a draw can be reproduced from its seed
+LAYOUTS = ('standard', 'random')
+
+@functools.lru_cache(maxsize=None)
+def standard_order(size):
+    # Seed numbers (1-based) in bracket slot order, e.g. 8 -> 1 8 4 5 2 7 3 6
+    order = [1]
+    while len(order) < size:
+        total = len(order) * 2 + 1
+        order = [seed for top in order for seed in (top, total - top)]
+    return tuple(order)
+
+# Slot tables for every size the bot offers, computed once at import
+SLOT_TABLES = {size: standard_order(size) for size in TOURNAMENT_SIZES}
+
+def layout_slots(team_ids, size, layout='standard', seed=None):
+    # Round-one slots for a field padded with byes to size
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown bracket layout: {layout}")
+
+    seeded = list(team_ids)
+    if layout == 'random':
+        random.Random(seed).shuffle(seeded)
+    seeded += [BYE] * (size - len(seeded))
+
+    order = SLOT_TABLES.get(size) or standard_order(size)
+    return [seeded[number - 1] for number in order]
+
+def new_match(round_number, match_number):
+    return {
+        'id': None,
+        'round': round_number,
+        'number': match_number,
+        'teams': [None, None],
+        'winner': None,
+        'next': None,
+    }
+
+def build_single_elimination(team_ids, layout='standard', seed=None):
+    bracket = new_bracket('single_elimination', team_ids, layout, seed)
+    resolve_first_round(bracket)
+    return bracket
+
+def new_bracket(bracket_format, team_ids, layout='standard', seed=None):
+    # An elimination tree with round one filled in and byes not yet
+    # resolved, so a format can add to it before teams start moving
+    if len(team_ids) < 2:
+        raise ValueError("At least two teams are needed for a bracket")
+
+    # Pad the field to the next power of two with byes
+    size = 1 << (len(team_ids) - 1).bit_length()
+    rounds = size.bit_length() - 1
+    slots = layout_slots(team_ids, size, layout, seed)
+
+    matches = []
+    offsets = []
+    for round_number in range(1, rounds + 1):
+        offsets.append(len(matches))
+        for match_number in range(1, (size >> round_number) + 1):
+            matches.append(new_match(round_number, match_number))
+
+    # Winner of match n moves into slot (n - 1) % 2 of match (n + 1) // 2
+    for match in matches:
+        if match['round'] < rounds:
+            next_index = offsets[match['round']] + (match['number'] - 1) // 2
+            match['next'] = [next_index, (match['number'] - 1) % 2]
+
+    half = size // 2
+    for i in range(half):
+        matches[i]['teams'] = [slots[2 * i], slots[2 * i + 1]]
+
+    return {
+        'format': bracket_format,
+        'layout': layout,
+        'seed': seed,
+        'rounds': rounds,
+        'offsets': offsets,
+        'matches': matches,
+        'champion': None,
+    }
+
+def resolve_first_round(bracket):
+    # Move teams drawn against a bye straight on
+    for index, match in enumerate(bracket['matches']):
+        if match['round'] > 1:
+            break
+        resolve_byes(bracket, index)
+
+def match_index(bracket, round_number, match_number):
+    return bracket['offsets'][round_number - 1] + match_number - 1
+
+def match_status(match):
+    if match['winner'] is not None:
+        return 'bye' if BYE in match['teams'] else 'completed'
+    if None in match['teams']:
+        return 'waiting'
+    return 'pending'
+
+def resolve_byes(bracket, index):
+    # Advance a team straight through a match against a bye.
+    # Returns the indexes of every match that changed.
+    match = bracket['matches'][index]
+    team_a, team_b = match['teams']
+    if match['winner'] is not None or None in match['teams'] or BYE not in match['teams']:
+        return []
+
+    match['winner'] = team_b if team_a == BYE else team_a
+    return [index] + advance(bracket, index)
+
+def advance(bracket, index):
+    match = bracket['matches'][index]
+    changed = []
+    if match.get('loser_next'):
+        team_a, team_b = match['teams']
+        loser_index, slot = match['loser_next']
+        bracket['matches'][loser_index]['teams'][slot] = team_b if match['winner'] == team_a else team_a
+        changed += [loser_index] + resolve_byes(bracket, loser_index)
+
+    if match['next'] is None:
+        if bracket['format'] in ELIMINATION_FORMATS:
+            bracket['champion'] = match['winner']
+        return changed
+
+    next_index, slot = match['next']
+    bracket['matches'][next_index]['teams'][slot] = match['winner']
+    return changed + [next_index] + resolve_byes(bracket, next_index)
+
+def record_result(bracket, index, winner_id):
+    match = bracket['matches'][index]
+    if match_status(match) != 'pending':
+        raise ValueError("Match is not open for results")
+    if winner_id not in match['teams']:
+        raise ValueError("Winner is not playing in this match")
+
+    match['winner'] = winner_id
+    return [index] + advance(bracket, index)
@@ -0,0 +1,169 @@
+import argparse
+import csv
+import json
+import sys
+import time
+from collections import Counter
+from contextlib import nullcontext
+from config import ALLOWED_TEAM_SIZES, ARCHIVE_PATH, DB_PATH
+from database import Database, RegistrationError
+
+# Bulk import and export of teams.
+#
+#   python bulk.py import league.csv --tournament 3
+#   python bulk.py export 3 > tournament-3.jsonl
+#   python bulk.py ratings
+#
+# CSV files have a header with tournament_id (optional with --tournament),
+# name, leader_username, roster and photos; roster and photos are separated
+# by ';'. JSON Lines files hold one team object per line with the same keys
+# and lists for roster and photos. Only teams are imported: the teams of an
+# export can be registered again (into another tournament with
+# --tournament), but its tournament and match records are skipped and
+# counted, not restored.
+# ratings rebuilds the leaderboard by replaying every completed match,
+# archived ones included.
+
+class ImportFailed(Exception):
+    pass
+
+def split_list(value):
+    return [item.strip() for item in (value or '').split(';') if item.strip()]
+
+def read_csv(stream):
+    for row in csv.DictReader(stream):
+        row['roster'] = split_list(row.get('roster'))
+        row['photos'] = split_list(row.get('photos'))
+        yield row
+
+def read_jsonl(stream, skipped=None):
+    for line in stream:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        # Export files also hold tournament and match records, which are
+        # counted in skipped by table
+        table = record.get('table', 'team')
+        if table == 'team':
+            yield record
+        elif skipped is not None:
+            skipped[table] += 1
+
+def validate(records, tournament_id=None):
+    # Yields database rows, raising ImportFailed on the first invalid record
+    for number, record in enumerate(records, start=1):
+        target = tournament_id or record.get('tournament_id')
+        name = (record.get('name') or '').strip()
+        leader = (record.get('leader_username') or '').strip().lstrip('@')
+        roster = record.get('roster') or []
+        photos = record.get('photos') or []
+
+        if not target:
+            raise ImportFailed(f"Record {number}: no tournament_id")
+        try:
+            target = int(target)
+        except (TypeError, ValueError):
+            raise ImportFailed(f"Record {number}: tournament_id {target!r} is not a number")
+        if not name or not leader:
+            raise ImportFailed(f"Record {number}: name and leader_username are required")
+        if len(roster) not in ALLOWED_TEAM_SIZES:
+            raise ImportFailed(f"Record {number}: roster of {len(roster)} players, expected {ALLOWED_TEAM_SIZES}")
+        yield target, name, leader, roster, photos
+
+def import_teams(db, stream, file_format, tournament_id=None, skipped=None):
+    records = read_csv(stream) if file_format == 'csv' else read_jsonl(stream, skipped)
+    return db.import_teams(validate(records, tournament_id))
+
+def export_tournament(db, tournament_id, out):
+    # Streams the tournament, its teams and its matches as JSON Lines,
+    # reading rows in batches rather than all at once
+    written = 0
+    with db.cursor() as cursor:
+        cursor.execute(
+            'SELECT id, name, max_teams, current_teams, status, created_at FROM tournaments WHERE id = ?',
+            (tournament_id,)
+        )
+        tournament = cursor.fetchone()
+        if not tournament:
+            raise ImportFailed(f"Tournament {tournament_id} not found")
+        keys = ('id', 'name', 'max_teams', 'current_teams', 'status', 'created_at')
+        out.write(json.dumps({'table': 'tournament', **dict(zip(keys, tournament))}) + '\n')
+        written += 1
+
+        cursor.execute(
+            '''
+            SELECT t.id, t.tournament_id, t.name, t.leader_username,
+                   (SELECT json_group_array(username) FROM (SELECT username FROM team_members WHERE team_id = t.id ORDER BY position)),
+                   (SELECT json_group_array(file_id) FROM (SELECT file_id FROM team_photos WHERE team_id = t.id ORDER BY position)),
+                   t.registered_at
+            FROM teams t WHERE t.tournament_id = ? ORDER BY t.id
+            ''',
+            (tournament_id,)
+        )
+        while rows := cursor.fetchmany(500):
+            for team_id, tid, name, leader, roster, photos, registered_at in rows:
+                out.write(json.dumps({
+                    'table': 'team', 'id': team_id, 'tournament_id': tid, 'name': name,
+                    'leader_username': leader, 'roster': json.loads(roster),
+                    'photos': json.loads(photos), 'registered_at': registered_at,
+                }) + '\n')
+                written += 1
+
+        cursor.execute(
+            'SELECT id, round_number, match_number, team_a_id, team_b_id, winner_id, status FROM matches WHERE tournament_id = ? ORDER BY id',
+            (tournament_id,)
+        )
+        keys = ('id', 'round_number', 'match_number', 'team_a_id', 'team_b_id', 'winner_id', 'status')
+        while rows := cursor.fetchmany(500):
+            for row in rows:
+                out.write(json.dumps({'table': 'match', **dict(zip(keys, row))}) + '\n')
+                written += 1
+    return written
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import and export of tournament teams")
+    parser.add_argument('--db', default=DB_PATH)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    importer = commands.add_parser('import', help="register teams from a CSV or JSON Lines file")
+    importer.add_argument('path', help="input file, or - for stdin")
+    importer.add_argument('--tournament', type=int, help="tournament id for rows without one")
+    importer.add_argument('--format', choices=['csv', 'jsonl'])
+
+    exporter = commands.add_parser('export', help="write a tournament as JSON Lines")
+    exporter.add_argument('tournament', type=int)
+    exporter.add_argument('-o', '--output', default='-', help="output file, or - for stdout")
+
+    commands.add_parser('ratings', help="rebuild ratings from every completed match")
+
+    args = parser.parse_args(argv)
+    db = Database(args.db, archive_path=ARCHIVE_PATH if args.command == 'ratings' else None)
+    started = time.perf_counter()
+
+    try:
+        if args.command == 'import':
+            file_format = args.format or ('csv' if args.path.endswith('.csv') else 'jsonl')
+            stream = nullcontext(sys.stdin) if args.path == '-' else open(args.path, newline='', encoding='utf-8')
+            skipped = Counter()
+            with stream as stream:
+                count = import_teams(db, stream, file_format, args.tournament, skipped)
+            for table, records in skipped.items():
+                print(f"import: skipped {records} {table} record(s); only teams are imported", file=sys.stderr)
+        elif args.command == 'ratings':
+            count = db.rebuild_ratings()
+        else:
+            stream = nullcontext(sys.stdout) if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+            with stream as stream:
+                count = export_tournament(db, args.tournament, stream)
+    except (ImportFailed, RegistrationError) as e:
+        print(f"{args.command} failed: {e}", file=sys.stderr)
+        return 1
+    finally:
+        db.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"{args.command}: {count} rows in {elapsed:.2f}s ({count / elapsed:.0f} rows/sec)", file=sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
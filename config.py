@@ -1,11 +1,41 @@
 import os
+import secrets
 from dotenv import load_dotenv
 
 load_dotenv()
 
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 ADMIN_IDS = list(map(int, os.getenv('ADMIN_IDS', '').split(','))) if os.getenv('ADMIN_IDS') else []
+DB_PATH = os.getenv('DB_PATH', 'tournament.db')
+
+# Registration sessions: 'sqlite' survives restarts and is shared by every
+# process using DB_PATH, 'memory' is neither and needs a single process
+SESSION_BACKEND = os.getenv('SESSION_BACKEND', 'sqlite')
+SESSION_TTL = int(os.getenv('SESSION_TTL', 3600))  # seconds before an abandoned registration expires
+
+# Webhook mode is used when WEBHOOK_URL is set, otherwise the bot polls.
+# Set WEBHOOK_SECRET explicitly when several instances share one webhook.
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8443))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', 'telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET') or secrets.token_urlsafe(32)
+CONCURRENT_UPDATES = int(os.getenv('CONCURRENT_UPDATES', 8))  # updates handled at once
+
+# Serve Prometheus metrics on this port; instrumentation is off when unset
+METRICS_PORT = int(os.getenv('METRICS_PORT', 0))
+
+# Finished tournaments move to the archive file this many days after their
+# final; a background job archives them and compacts the main database.
+# Set ARCHIVE_PATH empty to keep everything in the main database.
+ARCHIVE_PATH = os.getenv('ARCHIVE_PATH', 'tournament-archive.db')
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', 7))
+MAINTENANCE_INTERVAL = int(os.getenv('MAINTENANCE_INTERVAL', 3600))  # seconds between runs
+
+# Tournaments or teams shown per page in list views
+PAGE_SIZE = int(os.getenv('PAGE_SIZE', 10))
 
 # Tournament settings
 ALLOWED_TEAM_SIZES = [3, 4]
 TOURNAMENT_SIZES = [8, 16, 32, 64]
+BRACKET_LAYOUT = os.getenv('BRACKET_LAYOUT', 'standard')  # standard or random
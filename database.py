@@ -1,267 +1,1307 @@
 import sqlite3
 import json
+import re
+import asyncio
+import bisect
+import functools
+import itertools
+import random
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
+import formats
+import ratings
+from bracket import BYE, match_index, match_status, new_match
+from cache import LRUCache
+
+# Connection tuning applied once per connection. WAL lets readers run while a
+# write is in progress, and NORMAL sync is durable enough under WAL.
+PRAGMAS = [
+    # Only takes effect for a new file; older files are switched over by
+    # the first incremental_vacuum()
+    ('auto_vacuum', 'INCREMENTAL'),
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('cache_size', -8000),  # ~8 MB page cache
+    ('mmap_size', 64 * 1024 * 1024),
+    ('temp_store', 'MEMORY'),
+]
+
+# Compiled statements kept per connection, enough for every query below
+STATEMENT_CACHE_SIZE = 128
+
+# Teams read and inserted at a time by import_teams
+IMPORT_BATCH_SIZE = 500
+
+# Search index columns and the rows that fill it, shared by the main and
+# archive databases
+TEAMS_FTS_COLUMNS = "name, leader_username, roster, tokenize = 'unicode61 remove_diacritics 2'"
+TEAMS_FTS_SOURCE = '''
+    SELECT id, name, leader_username, coalesce((SELECT group_concat(username, ' ') FROM {schema}.team_members WHERE team_id = teams.id), '')
+    FROM {schema}.teams
+'''
+
+# Search hits weigh a team's name over its leader over its players
+TEAMS_FTS_WEIGHTS = (10.0, 4.0, 1.0)
+
+# Schema migrations applied on top of the base tables in init_db. Each entry
+# is a list of statements run in one transaction; PRAGMA user_version records
+# how many have been applied, so existing databases are upgraded in place.
+MIGRATIONS = [
+    # 1: indexes for the hot tournament, team and match lookups
+    [
+        'CREATE INDEX IF NOT EXISTS idx_tournaments_status ON tournaments (status)',
+        'CREATE INDEX IF NOT EXISTS idx_teams_tournament_name ON teams (tournament_id, name)',
+        'CREATE INDEX IF NOT EXISTS idx_matches_tournament_round ON matches (tournament_id, round_number, status)',
+    ],
+    # 2: team names are unique within a tournament
+    [
+        'DROP INDEX IF EXISTS idx_teams_tournament_name',
+        'CREATE UNIQUE INDEX idx_teams_tournament_name ON teams (tournament_id, name)',
+    ],
+    # 3: in-progress registrations, see sessions.SQLiteSessionStore
+    [
+        '''
+        CREATE TABLE registration_sessions (
+            user_id INTEGER PRIMARY KEY,
+            tournament_id INTEGER NOT NULL,
+            step INTEGER NOT NULL,
+            team_name TEXT,
+            leader_username TEXT,
+            roster TEXT NOT NULL,  -- JSON list of usernames
+            photos TEXT NOT NULL,  -- JSON list of photo file_ids
+            expires_at REAL NOT NULL
+        )
+        ''',
+        'CREATE INDEX idx_registration_sessions_expires ON registration_sessions (expires_at)',
+    ],
+    # 4: team listings are paged by id within a tournament
+    [
+        'CREATE INDEX idx_teams_tournament ON teams (tournament_id)',
+    ],
+    # 5: rosters and photos move from JSON columns on teams into their own
+    # tables, indexed by username for per-player lookups
+    [
+        '''
+        CREATE TABLE team_members (
+            team_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            username TEXT NOT NULL,
+            PRIMARY KEY (team_id, position),
+            FOREIGN KEY (team_id) REFERENCES teams (id)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE team_photos (
+            team_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            file_id TEXT NOT NULL,
+            PRIMARY KEY (team_id, position),
+            FOREIGN KEY (team_id) REFERENCES teams (id)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        INSERT INTO team_members (team_id, position, username)
+        SELECT teams.id, roster.key, ltrim(roster.value, '@') FROM teams, json_each(teams.roster) AS roster
+        ''',
+        '''
+        INSERT INTO team_photos (team_id, position, file_id)
+        SELECT teams.id, photos.key, photos.value FROM teams, json_each(teams.photos) AS photos
+        ''',
+        "UPDATE teams SET leader_username = ltrim(leader_username, '@')",
+        'ALTER TABLE teams DROP COLUMN roster',
+        'ALTER TABLE teams DROP COLUMN photos',
+        'CREATE INDEX idx_team_members_username ON team_members (username COLLATE NOCASE)',
+        'CREATE INDEX idx_teams_leader ON teams (leader_username COLLATE NOCASE)',
+    ],
+    # 6: completion time, so finished tournaments can be archived after a
+    # grace period
+    [
+        'ALTER TABLE tournaments ADD COLUMN completed_at TIMESTAMP',
+        "UPDATE tournaments SET completed_at = CURRENT_TIMESTAMP WHERE status = 'completed'",
+    ],
+    # 7: live bracket messages. bracket_version goes up with every change
+    # to the bracket; a subscription records the version and text hash its
+    # message last showed.
+    [
+        'ALTER TABLE tournaments ADD COLUMN bracket_version INTEGER NOT NULL DEFAULT 0',
+        '''
+        CREATE TABLE bracket_subscriptions (
+            tournament_id INTEGER NOT NULL,
+            chat_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            version INTEGER NOT NULL,
+            content_hash TEXT NOT NULL,
+            PRIMARY KEY (tournament_id, chat_id),
+            FOREIGN KEY (tournament_id) REFERENCES tournaments (id)
+        ) WITHOUT ROWID
+        ''',
+    ],
+    # 8: file_unique_ids of a registration's photos, to drop duplicates
+    [
+        "ALTER TABLE registration_sessions ADD COLUMN photo_keys TEXT NOT NULL DEFAULT '[]'",
+    ],
+    # 9: tournament formats, and standings kept up to date result by result
+    [
+        "ALTER TABLE tournaments ADD COLUMN format TEXT NOT NULL DEFAULT 'single_elimination'",
+        '''
+        CREATE TABLE standings (
+            tournament_id INTEGER NOT NULL,
+            team_id INTEGER NOT NULL,
+            played INTEGER NOT NULL DEFAULT 0,
+            wins INTEGER NOT NULL DEFAULT 0,
+            losses INTEGER NOT NULL DEFAULT 0,
+            buchholz INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (tournament_id, team_id),
+            FOREIGN KEY (tournament_id) REFERENCES tournaments (id),
+            FOREIGN KEY (team_id) REFERENCES teams (id)
+        ) WITHOUT ROWID
+        ''',
+    ],
+    # 10: ratings across tournaments, doubling as the leaderboard through
+    # the (kind, rating) index
+    [
+        '''
+        CREATE TABLE ratings (
+            kind TEXT NOT NULL,  -- 'team' or 'player'
+            key TEXT NOT NULL,  -- casefolded team name or username
+            name TEXT NOT NULL,
+            rating REAL NOT NULL,
+            games INTEGER NOT NULL,
+            wins INTEGER NOT NULL,
+            PRIMARY KEY (kind, key)
+        ) WITHOUT ROWID
+        ''',
+        'CREATE INDEX idx_ratings_leaderboard ON ratings (kind, rating DESC)',
+    ],
+    # 11: full-text index of team names, leaders and rosters, keyed by team
+    # id and kept in step with teams and team_members by triggers
+    [
+        f'CREATE VIRTUAL TABLE teams_fts USING fts5({TEAMS_FTS_COLUMNS})',
+        '''
+        CREATE TRIGGER teams_fts_insert AFTER INSERT ON teams BEGIN
+            INSERT INTO teams_fts (rowid, name, leader_username, roster) VALUES (new.id, new.name, new.leader_username, '');
+        END
+        ''',
+        '''
+        CREATE TRIGGER teams_fts_update AFTER UPDATE OF name, leader_username ON teams BEGIN
+            UPDATE teams_fts SET name = new.name, leader_username = new.leader_username WHERE rowid = new.id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER teams_fts_delete AFTER DELETE ON teams BEGIN
+            DELETE FROM teams_fts WHERE rowid = old.id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER teams_fts_member_insert AFTER INSERT ON team_members BEGIN
+            UPDATE teams_fts SET roster = roster || ' ' || new.username WHERE rowid = new.team_id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER teams_fts_member_delete AFTER DELETE ON team_members BEGIN
+            UPDATE teams_fts SET roster = coalesce((SELECT group_concat(username, ' ') FROM team_members WHERE team_id = old.team_id), '')
+            WHERE rowid = old.team_id;
+        END
+        ''',
+        f'INSERT INTO teams_fts (rowid, name, leader_username, roster) {TEAMS_FTS_SOURCE.format(schema="main")}',
+    ],
+    # 12: results numbered in the order they were entered, for replaying
+    # ratings. Earlier results fall back to their match id, and numbering
+    # carries on past every match id handed out so far.
+    [
+        'ALTER TABLE matches ADD COLUMN result_seq INTEGER',
+        "UPDATE matches SET result_seq = id WHERE status = 'completed'",
+        'CREATE TABLE sequences (name TEXT PRIMARY KEY, value INTEGER NOT NULL) WITHOUT ROWID',
+        "INSERT INTO sequences (name, value) VALUES ('results', coalesce((SELECT seq FROM sqlite_sequence WHERE name = 'matches'), 0))",
+    ],
+    # 13: each match keeps its own place in the bracket (where its winner
+    # and loser move on to, which slots hold a bye), so a result reads and
+    # writes the matches it touches instead of the whole bracket_data
+    # blob; bracket_data keeps the format settings and round offsets
+    [
+        'ALTER TABLE matches ADD COLUMN next_index INTEGER',
+        'ALTER TABLE matches ADD COLUMN next_slot INTEGER',
+        'ALTER TABLE matches ADD COLUMN loser_next_index INTEGER',
+        'ALTER TABLE matches ADD COLUMN loser_next_slot INTEGER',
+        'ALTER TABLE matches ADD COLUMN bye_slots INTEGER NOT NULL DEFAULT 0',
+        'CREATE INDEX idx_matches_position ON matches (tournament_id, round_number, match_number)',
+        'CREATE INDEX idx_matches_team_a ON matches (team_a_id)',
+        'CREATE INDEX idx_matches_team_b ON matches (team_b_id)',
+        '''
+        UPDATE matches SET
+            next_index = json_extract(m.value, '$.next[0]'),
+            next_slot = json_extract(m.value, '$.next[1]'),
+            loser_next_index = json_extract(m.value, '$.loser_next[0]'),
+            loser_next_slot = json_extract(m.value, '$.loser_next[1]'),
+            bye_slots = (json_extract(m.value, '$.teams[0]') IS 0) + 2 * (json_extract(m.value, '$.teams[1]') IS 0)
+        FROM tournaments t, json_each(t.bracket_data, '$.matches') m
+        WHERE t.bracket_data IS NOT NULL AND matches.id = json_extract(m.value, '$.id')
+        ''',
+        "UPDATE tournaments SET bracket_data = json_remove(bracket_data, '$.matches', '$.remaining', '$.opponents', '$.beaten') WHERE bracket_data IS NOT NULL",
+    ],
+    # 14: sessions are saved by compare-and-swap on version, and tournament
+    # creation keeps its name in its own column instead of team_name with
+    # tournament_id 0 (its steps are 4 and 5, see bot.py)
+    [
+        '''
+        CREATE TABLE registration_sessions_new (
+            user_id INTEGER PRIMARY KEY,
+            tournament_id INTEGER,
+            step INTEGER NOT NULL,
+            team_name TEXT,
+            leader_username TEXT,
+            roster TEXT NOT NULL,  -- JSON list of usernames
+            photos TEXT NOT NULL,  -- JSON list of photo file_ids
+            expires_at REAL NOT NULL,
+            photo_keys TEXT NOT NULL DEFAULT '[]',
+            tournament_name TEXT,
+            version INTEGER NOT NULL DEFAULT 1
+        )
+        ''',
+        '''
+        INSERT INTO registration_sessions_new
+        SELECT user_id, nullif(tournament_id, 0), step, CASE WHEN step IN (4, 5) THEN NULL ELSE team_name END,
+               leader_username, roster, photos, expires_at, photo_keys, CASE WHEN step IN (4, 5) THEN team_name END, 1
+        FROM registration_sessions
+        ''',
+        'DROP TABLE registration_sessions',
+        'ALTER TABLE registration_sessions_new RENAME TO registration_sessions',
+        'CREATE INDEX idx_registration_sessions_expires ON registration_sessions (expires_at)',
+    ],
+]
+
+# Bracket keys held by the matches table rather than in bracket_data; see
+# StoredMatches and Database.fetch_history
+ROW_STATE = ('matches', 'remaining', 'opponents', 'beaten')
+
+# Match columns the bracket engine works from, in match_from_row order
+MATCH_COLUMNS = 'id, round_number, match_number, team_a_id, team_b_id, winner_id, status, next_index, next_slot, loser_next_index, loser_next_slot, bye_slots'
+
+# Tables of the attached archive database. Finished tournaments are moved
+# here with their ids, so history keeps its references; rows are never
+# updated once written.
+ARCHIVE_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS archive.tournaments (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        max_teams INTEGER NOT NULL,
+        current_teams INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        created_at TIMESTAMP,
+        completed_at TIMESTAMP,
+        bracket_data TEXT,
+        archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS archive.teams (
+        id INTEGER PRIMARY KEY,
+        tournament_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        leader_username TEXT NOT NULL,
+        registered_at TIMESTAMP
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS archive.idx_teams_tournament ON teams (tournament_id)',
+    '''
+    CREATE TABLE IF NOT EXISTS archive.team_members (
+        team_id INTEGER NOT NULL,
+        position INTEGER NOT NULL,
+        username TEXT NOT NULL,
+        PRIMARY KEY (team_id, position)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS archive.team_photos (
+        team_id INTEGER NOT NULL,
+        position INTEGER NOT NULL,
+        file_id TEXT NOT NULL,
+        PRIMARY KEY (team_id, position)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS archive.matches (
+        id INTEGER PRIMARY KEY,
+        tournament_id INTEGER NOT NULL,
+        round_number INTEGER,
+        match_number INTEGER,
+        team_a_id INTEGER,
+        team_b_id INTEGER,
+        winner_id INTEGER,
+        status TEXT,
+        result_seq INTEGER
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS archive.idx_matches_tournament ON matches (tournament_id)',
+    '''
+    CREATE TABLE IF NOT EXISTS archive.standings (
+        tournament_id INTEGER NOT NULL,
+        team_id INTEGER NOT NULL,
+        played INTEGER NOT NULL,
+        wins INTEGER NOT NULL,
+        losses INTEGER NOT NULL,
+        buchholz INTEGER NOT NULL,
+        PRIMARY KEY (tournament_id, team_id)
+    ) WITHOUT ROWID
+    ''',
+    f'CREATE VIRTUAL TABLE IF NOT EXISTS archive.teams_fts USING fts5({TEAMS_FTS_COLUMNS})',
+]
+
+# A match joined to its team names, as rendered in bracket views
+BracketMatch = namedtuple(
+    'BracketMatch',
+    'id round_number match_number team_a_id team_a_name team_b_id team_b_name winner_id status'
+)
+
+# A team's line in the standings
+Standing = namedtuple('Standing', 'team_id name played wins losses buchholz')
+
+# A team found by search_teams
+SearchResult = namedtuple('SearchResult', 'team_id tournament_id tournament_name name leader_username archived')
+
+# One page of a keyset-paginated listing
+Page = namedtuple('Page', 'rows has_prev has_next')
+
+class RegistrationError(Exception):
+    pass
+
+def match_row(tournament_id, match):
+    # A bracket match as the values of an insert into matches
+    teams = match['teams']
+    next_index, next_slot = match['next'] or (None, None)
+    loser_index, loser_slot = match.get('loser_next') or (None, None)
+    return (
+        tournament_id, match['round'], match['number'], teams[0] or None, teams[1] or None,
+        match['winner'] or None, match_status(match), next_index, next_slot, loser_index, loser_slot, bye_slots(match)
+    )
+
+def match_from_row(row):
+    # A bracket match rebuilt from MATCH_COLUMNS; a NULL slot is a bye when
+    # bye_slots says so, and a bye match without a winner was won by one
+    match_id, round_number, match_number, team_a, team_b, winner, status, next_index, next_slot, loser_index, loser_slot, byes = row
+    match = new_match(round_number, match_number)
+    match['id'] = match_id
+    match['teams'] = [BYE if byes & 1 else team_a, BYE if byes & 2 else team_b]
+    match['winner'] = BYE if winner is None and status == 'bye' else winner
+    if next_index is not None:
+        match['next'] = [next_index, next_slot]
+    if loser_index is not None:
+        match['loser_next'] = [loser_index, loser_slot]
+    return match
+
+def bye_slots(match):
+    # Bit 1 for a bye in slot a, bit 2 for slot b
+    return sum(bit for bit, team in zip((1, 2), match['teams']) if team == BYE)
+
+class StoredMatches(dict):
+    # A bracket's 'matches', keyed by index and read from the matches table
+    # as the engine reaches them, so recording a result loads the few
+    # matches teams move through rather than the whole bracket
+    def __init__(self, cursor, tournament_id, offsets):
+        super().__init__()
+        self.cursor = cursor
+        self.tournament_id = tournament_id
+        self.offsets = offsets
+        self.count = None
+
+    def __missing__(self, index):
+        round_number = bisect.bisect_right(self.offsets, index)
+        self.cursor.execute(
+            f'SELECT {MATCH_COLUMNS} FROM matches WHERE tournament_id = ? AND round_number = ? AND match_number = ?',
+            (self.tournament_id, round_number, index - self.offsets[round_number - 1] + 1)
+        )
+        match = self[index] = match_from_row(self.cursor.fetchone())
+        return match
+
+    def __len__(self):
+        # Only a swiss pairing asks, to add its round after the stored ones
+        if self.count is None:
+            self.cursor.execute('SELECT COUNT(*) FROM matches WHERE tournament_id = ?', (self.tournament_id,))
+            self.count = self.cursor.fetchone()[0]
+        return self.count
+
+    def append(self, match):
+        self[len(self)] = match
+        self.count += 1
 
 class Database:
-    def __init__(self, db_path='tournament.db'):
+    def __init__(self, db_path='tournament.db', cache_size=256, cache_ttl=60, page_size=10, archive_path=None):
         self.db_path = db_path
+        # Separate file for finished tournaments; archiving is off without one
+        self.archive_path = archive_path
+        self.page_size = page_size
+        self.lock = threading.RLock()
+        # Read-through cache for tournaments, active list and team lists,
+        # invalidated by every write that changes them
+        self.cache = LRUCache(cache_size, cache_ttl)
+        # Connections opened over the Database's life, exported as a gauge
+        # when metrics are on
+        self.connections_opened = 0
+        self.conn = self.connect()
         self.init_db()
 
+    def connect(self):
+        # One long-lived connection shared by the event loop and worker
+        # threads; access is serialized through self.lock
+        conn = sqlite3.connect(
+            self.db_path,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+            isolation_level=None
+        )
+        for pragma, value in PRAGMAS:
+            conn.execute(f'PRAGMA {pragma} = {value}')
+        if self.archive_path:
+            conn.execute('ATTACH DATABASE ? AS archive', (self.archive_path,))
+            conn.execute('PRAGMA archive.journal_mode = WAL')
+        self.connections_opened += 1
+        return conn
+
+    @contextmanager
+    def cursor(self, write=False):
+        with self.lock:
+            cursor = self.conn.cursor()
+            try:
+                if write:
+                    # Take the write lock up front so concurrent writers,
+                    # including other processes, queue instead of racing
+                    cursor.execute('BEGIN IMMEDIATE')
+                yield cursor
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+            finally:
+                cursor.close()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
     def init_db(self):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Tournaments table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS tournaments (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                max_teams INTEGER NOT NULL,
-                current_teams INTEGER DEFAULT 0,
-                status TEXT DEFAULT 'registration',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                bracket_data TEXT
+        with self.cursor(write=True) as cursor:
+            # Tournaments table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS tournaments (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL,
+                    max_teams INTEGER NOT NULL,
+                    current_teams INTEGER DEFAULT 0,
+                    status TEXT DEFAULT 'registration',
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    bracket_data TEXT
+                )
+            ''')
+
+            # Teams table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS teams (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    tournament_id INTEGER,
+                    name TEXT NOT NULL,
+                    leader_username TEXT NOT NULL,
+                    roster TEXT NOT NULL,  -- JSON, moved to team_members by migration 5
+                    photos TEXT NOT NULL,  -- JSON, moved to team_photos by migration 5
+                    registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (tournament_id) REFERENCES tournaments (id)
+                )
+            ''')
+
+            # Matches table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS matches (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    tournament_id INTEGER,
+                    round_number INTEGER,
+                    match_number INTEGER,
+                    team_a_id INTEGER,
+                    team_b_id INTEGER,
+                    winner_id INTEGER,
+                    status TEXT DEFAULT 'pending',
+                    FOREIGN KEY (tournament_id) REFERENCES tournaments (id),
+                    FOREIGN KEY (team_a_id) REFERENCES teams (id),
+                    FOREIGN KEY (team_b_id) REFERENCES teams (id),
+                    FOREIGN KEY (winner_id) REFERENCES teams (id)
+                )
+            ''')
+
+        self.migrate()
+        if self.archive_path:
+            with self.cursor(write=True) as cursor:
+                for statement in ARCHIVE_SCHEMA:
+                    cursor.execute(statement)
+                # Archives from before result numbering get the column;
+                # their results replay in match id order
+                cursor.execute("SELECT 1 FROM pragma_table_info('matches', 'archive') WHERE name = 'result_seq'")
+                if not cursor.fetchone():
+                    cursor.execute('ALTER TABLE archive.matches ADD COLUMN result_seq INTEGER')
+                # Archives written before the search index existed are
+                # indexed once
+                cursor.execute('SELECT EXISTS (SELECT 1 FROM archive.teams) AND NOT EXISTS (SELECT 1 FROM archive.teams_fts)')
+                if cursor.fetchone()[0]:
+                    cursor.execute(f'INSERT INTO archive.teams_fts (rowid, name, leader_username, roster) {TEAMS_FTS_SOURCE.format(schema="archive")}')
+
+    def migrate(self):
+        with self.lock:
+            version = self.conn.execute('PRAGMA user_version').fetchone()[0]
+            for number in range(version + 1, len(MIGRATIONS) + 1):
+                with self.cursor(write=True) as cursor:
+                    for statement in MIGRATIONS[number - 1]:
+                        cursor.execute(statement)
+                    cursor.execute(f'PRAGMA user_version = {number}')
+
+    def invalidate_tournament(self, tournament_id):
+        self.cache.invalidate(
+            ('tournament', tournament_id),
+            ('teams', tournament_id),
+            ('active',)
+        )
+
+    def create_tournament(self, name, max_teams, bracket_format='single_elimination'):
+        with self.cursor(write=True) as cursor:
+            cursor.execute(
+                'INSERT INTO tournaments (name, max_teams, format) VALUES (?, ?, ?)',
+                (name, max_teams, bracket_format)
             )
-        ''')
-        
-        # Teams table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS teams (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                tournament_id INTEGER,
-                name TEXT NOT NULL,
-                leader_username TEXT NOT NULL,
-                roster TEXT NOT NULL,  # JSON string of roster data
-                photos TEXT NOT NULL,   # JSON string of photo file_ids
-                registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (tournament_id) REFERENCES tournaments (id)
+            tournament_id = cursor.lastrowid
+            self.invalidate_tournament(tournament_id)
+            return tournament_id
+
+    def get_tournament(self, tournament_id):
+        def load():
+            with self.cursor() as cursor:
+                cursor.execute('SELECT * FROM tournaments WHERE id = ?', (tournament_id,))
+                return cursor.fetchone()
+
+        with self.lock:
+            return self.cache.get_or_load(('tournament', tournament_id), load)
+
+    def fetch_page(self, query, params, after_id, before_id, limit):
+        # Keyset pagination on id. Only limit + 1 rows are read; the extra row
+        # tells whether there is more in the direction of travel.
+        with self.cursor() as cursor:
+            if before_id:
+                cursor.execute(f'{query} AND id < ? ORDER BY id DESC LIMIT ?', (*params, before_id, limit + 1))
+                rows = cursor.fetchall()
+                return Page(rows[:limit][::-1], len(rows) > limit, True)
+
+            cursor.execute(f'{query} AND id > ? ORDER BY id LIMIT ?', (*params, after_id or 0, limit + 1))
+            rows = cursor.fetchall()
+            return Page(rows[:limit], bool(after_id), len(rows) > limit)
+
+    def get_active_tournaments(self, after_id=None, before_id=None, limit=None):
+        # Listing columns only; bracket_data stays out of list views
+        limit = limit or self.page_size
+
+        def load():
+            return self.fetch_page(
+                "SELECT id, name, max_teams, current_teams, status FROM tournaments WHERE status = 'registration'",
+                (), after_id, before_id, limit
             )
-        ''')
-        
-        # Matches table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS matches (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                tournament_id INTEGER,
-                round_number INTEGER,
-                match_number INTEGER,
-                team_a_id INTEGER,
-                team_b_id INTEGER,
-                winner_id INTEGER,
-                status TEXT DEFAULT 'pending',
-                FOREIGN KEY (tournament_id) REFERENCES tournaments (id),
-                FOREIGN KEY (team_a_id) REFERENCES teams (id),
-                FOREIGN KEY (team_b_id) REFERENCES teams (id),
-                FOREIGN KEY (winner_id) REFERENCES teams (id)
+
+        # Only the default first page, which every "View Tournaments" tap
+        # reads, is cached
+        if after_id or before_id or limit != self.page_size:
+            return load()
+        with self.lock:
+            return self.cache.get_or_load(('active',), load)
+
+    def register_team(self, tournament_id, name, leader_username, roster, photos):
+        try:
+            with self.cursor(write=True) as cursor:
+                # Claim a slot only if one is still free
+                cursor.execute(
+                    "UPDATE tournaments SET current_teams = current_teams + 1 WHERE id = ? AND status = 'registration' AND current_teams < max_teams",
+                    (tournament_id,)
+                )
+                if cursor.rowcount == 0:
+                    raise RegistrationError("Tournament is full or registration has closed")
+
+                # Register team; the unique index rejects duplicate names
+                try:
+                    cursor.execute(
+                        'INSERT INTO teams (tournament_id, name, leader_username) VALUES (?, ?, ?)',
+                        (tournament_id, name, leader_username.lstrip('@'))
+                    )
+                except sqlite3.IntegrityError:
+                    raise RegistrationError("Team name already exists in this tournament")
+                team_id = cursor.lastrowid
+                cursor.executemany(
+                    'INSERT INTO team_members (team_id, position, username) VALUES (?, ?, ?)',
+                    [(team_id, position, username.lstrip('@')) for position, username in enumerate(roster)]
+                )
+                cursor.executemany(
+                    'INSERT INTO team_photos (team_id, position, file_id) VALUES (?, ?, ?)',
+                    [(team_id, position, file_id) for position, file_id in enumerate(photos)]
+                )
+
+                cursor.execute(
+                    'SELECT current_teams = max_teams FROM tournaments WHERE id = ?',
+                    (tournament_id,)
+                )
+                is_full = bool(cursor.fetchone()[0])
+                self.invalidate_tournament(tournament_id)
+        except RegistrationError as e:
+            return False, str(e), False
+
+        return True, "Team registered successfully", is_full
+
+    def import_teams(self, teams):
+        # Bulk-register (tournament_id, name, leader_username, roster, photos)
+        # rows in one transaction. The iterable is read IMPORT_BATCH_SIZE
+        # teams at a time, each batch inserted with its members and photos
+        # before the next is read; any error, or a tournament left over
+        # capacity, rolls the whole import back. Returns the number of
+        # teams inserted.
+        tournament_ids = set()
+        count = 0
+        rows = iter(teams)
+
+        with self.cursor(write=True) as cursor:
+            while batch := list(itertools.islice(rows, IMPORT_BATCH_SIZE)):
+                members = []
+                photo_rows = []
+                for tournament_id, name, leader_username, roster, photos in batch:
+                    tournament_ids.add(tournament_id)
+                    members.extend((tournament_id, name, position, username.lstrip('@')) for position, username in enumerate(roster))
+                    photo_rows.extend((tournament_id, name, position, file_id) for position, file_id in enumerate(photos))
+                try:
+                    cursor.executemany(
+                        'INSERT INTO teams (tournament_id, name, leader_username) VALUES (?, ?, ?)',
+                        [(tournament_id, name, leader_username.lstrip('@')) for tournament_id, name, leader_username, _, _ in batch]
+                    )
+                except sqlite3.IntegrityError as e:
+                    raise RegistrationError(f"Duplicate team name: {e}")
+                count += cursor.rowcount
+
+                # Team ids are looked up through the unique (tournament_id, name) index
+                cursor.executemany(
+                    'INSERT INTO team_members (team_id, position, username) VALUES ((SELECT id FROM teams WHERE tournament_id = ? AND name = ?), ?, ?)',
+                    members
+                )
+                cursor.executemany(
+                    'INSERT INTO team_photos (team_id, position, file_id) VALUES ((SELECT id FROM teams WHERE tournament_id = ? AND name = ?), ?, ?)',
+                    photo_rows
+                )
+
+            for tournament_id in tournament_ids:
+                cursor.execute(
+                    "UPDATE tournaments SET current_teams = (SELECT COUNT(*) FROM teams WHERE tournament_id = ?) WHERE id = ? AND status = 'registration'",
+                    (tournament_id, tournament_id)
+                )
+                if cursor.rowcount == 0:
+                    raise RegistrationError(f"Tournament {tournament_id} is not open for registration")
+                cursor.execute('SELECT current_teams > max_teams FROM tournaments WHERE id = ?', (tournament_id,))
+                if cursor.fetchone()[0]:
+                    raise RegistrationError(f"Tournament {tournament_id} would be over capacity")
+                self.invalidate_tournament(tournament_id)
+            return count
+
+    def get_tournament_teams(self, tournament_id, after_id=None, before_id=None, limit=None):
+        limit = limit or self.page_size
+
+        def load():
+            return self.fetch_page(
+                'SELECT * FROM teams WHERE tournament_id = ?',
+                (tournament_id,), after_id, before_id, limit
             )
-        ''')
-        
-        conn.commit()
-        conn.close()
-
-    def create_tournament(self, name, max_teams):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute(
-            'INSERT INTO tournaments (name, max_teams) VALUES (?, ?)',
-            (name, max_teams)
+
+        if after_id or before_id or limit != self.page_size:
+            return load()
+        with self.lock:
+            return self.cache.get_or_load(('teams', tournament_id), load)
+
+    def get_team_details(self, team_id):
+        # (id, tournament_id, name, leader_username, roster, photos, registered_at)
+        with self.cursor() as cursor:
+            cursor.execute('SELECT * FROM teams WHERE id = ?', (team_id,))
+            team = cursor.fetchone()
+            if not team:
+                return None
+            cursor.execute('SELECT username FROM team_members WHERE team_id = ? ORDER BY position', (team_id,))
+            roster = [row[0] for row in cursor.fetchall()]
+            cursor.execute('SELECT file_id FROM team_photos WHERE team_id = ? ORDER BY position', (team_id,))
+            photos = [row[0] for row in cursor.fetchall()]
+            return (*team[:4], roster, photos, team[4])
+
+    def get_user_teams(self, username, limit=20):
+        # Teams a user leads or plays in, newest first, with their tournament
+        with self.cursor() as cursor:
+            cursor.execute(
+                '''
+                SELECT t.id, t.tournament_id, t.name, t.leader_username, tr.name, tr.status
+                FROM teams t
+                JOIN tournaments tr ON tr.id = t.tournament_id
+                WHERE t.id IN (
+                    SELECT team_id FROM team_members WHERE username = ? COLLATE NOCASE
+                    UNION
+                    SELECT id FROM teams WHERE leader_username = ? COLLATE NOCASE
+                )
+                ORDER BY t.id DESC
+                LIMIT ?
+                ''',
+                (username, username, limit)
+            )
+            return cursor.fetchall()
+
+    def create_bracket(self, tournament_id, layout='standard', seed=None):
+        with self.cursor(write=True) as cursor:
+            # Only a tournament still in registration can be started
+            cursor.execute(
+                "UPDATE tournaments SET status = 'ongoing' WHERE id = ? AND status = 'registration'",
+                (tournament_id,)
+            )
+            if cursor.rowcount == 0:
+                return False
+            self.invalidate_tournament(tournament_id)
+
+            # Teams in registration order are the seed order
+            cursor.execute('SELECT format FROM tournaments WHERE id = ?', (tournament_id,))
+            bracket_format = cursor.fetchone()[0]
+            cursor.execute('SELECT id FROM teams WHERE tournament_id = ? ORDER BY id', (tournament_id,))
+            team_ids = [row[0] for row in cursor.fetchall()]
+            if layout == 'random' and seed is None:
+                seed = random.randrange(2 ** 32)
+            bracket = formats.build(bracket_format, team_ids, layout, seed)
+
+            # Create every match known so far in one batch; later rounds
+            # wait for their teams
+            self.insert_matches(cursor, tournament_id, bracket, range(len(bracket['matches'])))
+
+            # A swiss bye in round one counts as a win
+            byes = set(bracket.get('byes', []))
+            cursor.executemany(
+                'INSERT INTO standings (tournament_id, team_id, played, wins) VALUES (?, ?, ?, ?)',
+                [(tournament_id, team_id, int(team_id in byes), int(team_id in byes)) for team_id in team_ids]
+            )
+
+            cursor.execute(
+                'UPDATE tournaments SET bracket_data = ?, bracket_version = bracket_version + 1 WHERE id = ?',
+                (self.dump_bracket(bracket), tournament_id)
+            )
+            return True
+
+    def get_current_matches(self, tournament_id, round_number=None):
+        with self.cursor() as cursor:
+            if round_number:
+                cursor.execute(
+                    "SELECT * FROM matches WHERE tournament_id = ? AND round_number = ? AND status = 'pending'",
+                    (tournament_id, round_number)
+                )
+            else:
+                cursor.execute(
+                    "SELECT * FROM matches WHERE tournament_id = ? AND status = 'pending'",
+                    (tournament_id,)
+                )
+            return cursor.fetchall()
+
+    def get_bracket(self, tournament_id, round_number=None):
+        # Every match (or one round's) with team names in a single query,
+        # grouped as {round_number: [BracketMatch, ...]}
+        query = '''
+            SELECT m.id, m.round_number, m.match_number,
+                   m.team_a_id, a.name, m.team_b_id, b.name,
+                   m.winner_id, m.status
+            FROM matches m
+            LEFT JOIN teams a ON a.id = m.team_a_id
+            LEFT JOIN teams b ON b.id = m.team_b_id
+            WHERE m.tournament_id = ?
+        '''
+        params = [tournament_id]
+        if round_number:
+            query += ' AND m.round_number = ?'
+            params.append(round_number)
+        query += ' ORDER BY m.round_number, m.match_number'
+
+        with self.cursor() as cursor:
+            cursor.execute(query, params)
+            rounds = {}
+            for row in cursor.fetchall():
+                match = BracketMatch(*row)
+                rounds.setdefault(match.round_number, []).append(match)
+            return rounds
+
+    def insert_matches(self, cursor, tournament_id, bracket, indexes):
+        # Insert the bracket's matches at indexes, each with its place in
+        # the bracket
+        cursor.executemany(
+            '''
+            INSERT INTO matches (tournament_id, round_number, match_number, team_a_id, team_b_id, winner_id, status,
+                                 next_index, next_slot, loser_next_index, loser_next_slot, bye_slots)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''',
+            [match_row(tournament_id, bracket['matches'][index]) for index in indexes]
         )
-        tournament_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        return tournament_id
 
-    def get_tournament(self, tournament_id):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM tournaments WHERE id = ?', (tournament_id,))
-        result = cursor.fetchone()
-        conn.close()
-        return result
-
-    def get_active_tournaments(self):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM tournaments WHERE status = "registration"')
-        results = cursor.fetchall()
-        conn.close()
-        return results
+    def load_bracket(self, cursor, tournament_id, bracket_data):
+        # The bracket with its matches read from the matches table on
+        # demand; a league also gets the results still to come
+        bracket = json.loads(bracket_data)
+        bracket['matches'] = StoredMatches(cursor, tournament_id, bracket['offsets'])
+        if bracket['format'] in formats.LEAGUE_FORMATS:
+            cursor.execute("SELECT COUNT(*) FROM matches WHERE tournament_id = ? AND status = 'pending'", (tournament_id,))
+            bracket['remaining'] = cursor.fetchone()[0]
+        return bracket
 
-    def register_team(self, tournament_id, name, leader_username, roster, photos):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Check if team name already exists in tournament
+    def dump_bracket(self, bracket):
+        return json.dumps({key: value for key, value in bracket.items() if key not in ROW_STATE})
+
+    def fetch_opponents(self, cursor, team_id):
         cursor.execute(
-            'SELECT id FROM teams WHERE tournament_id = ? AND name = ?',
-            (tournament_id, name)
+            "SELECT CASE WHEN team_a_id = ? THEN team_b_id ELSE team_a_id END FROM matches WHERE status = 'completed' AND (team_a_id = ? OR team_b_id = ?)",
+            (team_id, team_id, team_id)
         )
-        if cursor.fetchone():
-            conn.close()
-            return False, "Team name already exists in this tournament"
-        
-        # Check if tournament is full
+        return [row[0] for row in cursor.fetchall()]
+
+    def fetch_history(self, cursor, tournament_id, bracket):
+        # Fill in every team's opponents and the teams it beat, for ranking
+        # and pairing, from the tournament's results
         cursor.execute(
-            'SELECT current_teams, max_teams FROM tournaments WHERE id = ?',
+            "SELECT team_a_id, team_b_id, winner_id FROM matches WHERE tournament_id = ? AND status = 'completed'",
             (tournament_id,)
         )
-        tournament = cursor.fetchone()
-        if tournament[0] >= tournament[1]:
-            conn.close()
-            return False, "Tournament is full"
-        
-        # Register team
-        cursor.execute(
-            'INSERT INTO teams (tournament_id, name, leader_username, roster, photos) VALUES (?, ?, ?, ?, ?)',
-            (tournament_id, name, leader_username, json.dumps(roster), json.dumps(photos))
-        )
-        
-        # Update team count
+        opponents = bracket['opponents'] = {}
+        beaten = bracket['beaten'] = {}
+        for team_a, team_b, winner in cursor.fetchall():
+            opponents.setdefault(str(team_a), []).append(team_b)
+            opponents.setdefault(str(team_b), []).append(team_a)
+            beaten.setdefault(str(winner), []).append(team_b if winner == team_a else team_a)
+        return bracket
+
+    def fetch_standings(self, cursor, tournament_id):
         cursor.execute(
-            'UPDATE tournaments SET current_teams = current_teams + 1 WHERE id = ?',
+            '''
+            SELECT s.team_id, t.name, s.played, s.wins, s.losses, s.buchholz
+            FROM standings s JOIN teams t ON t.id = s.team_id
+            WHERE s.tournament_id = ?
+            ''',
             (tournament_id,)
         )
-        
-        # Check if tournament is now full
-        cursor.execute(
-            'SELECT current_teams, max_teams FROM tournaments WHERE id = ?',
-            (tournament_id,)
+        return [Standing(*row) for row in cursor.fetchall()]
+
+    def apply_standings(self, cursor, tournament_id, deltas):
+        cursor.executemany(
+            '''
+            UPDATE standings SET played = played + ? + ?, wins = wins + ?, losses = losses + ?, buchholz = buchholz + ?
+            WHERE tournament_id = ? AND team_id = ?
+            ''',
+            [(wins, losses, wins, losses, buchholz, tournament_id, team_id) for team_id, wins, losses, buchholz in deltas]
         )
-        updated_tournament = cursor.fetchone()
-        
-        conn.commit()
-        conn.close()
-        
-        is_full = updated_tournament[0] == updated_tournament[1]
-        return True, "Team registered successfully", is_full
 
-    def get_tournament_teams(self, tournament_id):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM teams WHERE tournament_id = ?', (tournament_id,))
-        results = cursor.fetchall()
-        conn.close()
-        return results
+    def apply_ratings(self, cursor, winner_id, loser_id):
+        # Rate one result: reads and writes only the two teams and their
+        # players
+        cursor.execute('SELECT id, name FROM teams WHERE id IN (?, ?)', (winner_id, loser_id))
+        names = dict(cursor.fetchall())
+        cursor.execute('SELECT team_id, username FROM team_members WHERE team_id IN (?, ?) ORDER BY team_id, position', (winner_id, loser_id))
+        rosters = {winner_id: [], loser_id: []}
+        for team_id, username in cursor.fetchall():
+            rosters[team_id].append(username)
 
-    def get_team_details(self, team_id):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM teams WHERE id = ?', (team_id,))
-        result = cursor.fetchone()
-        conn.close()
-        return result
-
-    def create_bracket(self, tournament_id):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Update tournament status
+        winner = (names[winner_id], rosters[winner_id])
+        loser = (names[loser_id], rosters[loser_id])
+        keys = [ratings.team_key(names[team_id]) for team_id in (winner_id, loser_id)]
+        keys += [ratings.player_key(username) for roster in rosters.values() for username in roster]
         cursor.execute(
-            'UPDATE tournaments SET status = "ongoing" WHERE id = ?',
-            (tournament_id,)
+            f'SELECT kind, key, rating FROM ratings WHERE (kind, key) IN (VALUES {", ".join(["(?, ?)"] * len(keys))})',
+            [part for key in keys for part in key]
         )
-        
-        # Get all teams for the tournament
-        teams = self.get_tournament_teams(tournament_id)
-        
-        # Create first round matches
-        round_number = 1
-        for i in range(0, len(teams), 2):
-            if i + 1 < len(teams):
-                cursor.execute(
-                    'INSERT INTO matches (tournament_id, round_number, match_number, team_a_id, team_b_id) VALUES (?, ?, ?, ?, ?)',
-                    (tournament_id, round_number, (i//2)+1, teams[i][0], teams[i+1][0])
+        current = {(kind, key): rating for kind, key, rating in cursor.fetchall()}
+
+        cursor.executemany(
+            '''
+            INSERT INTO ratings (kind, key, name, rating, games, wins) VALUES (?, ?, ?, ?, 1, ?)
+            ON CONFLICT (kind, key) DO UPDATE SET
+                name = excluded.name, rating = excluded.rating, games = games + 1, wins = wins + excluded.wins
+            ''',
+            [(*key, name, rating, won) for key, (rating, name, won) in ratings.rate_match(current, winner, loser).items()]
+        )
+
+    def rebuild_ratings(self):
+        # Backfill: replay every completed match, archived ones included,
+        # in the order the results were entered, keeping ratings in memory
+        # and writing them once. Returns the number of matches replayed.
+        sources = ['main'] + (['archive'] if self.archive_path else [])
+        with self.cursor(write=True) as cursor:
+            names = {}
+            rosters = {}
+            for source in sources:
+                cursor.execute(f'SELECT id, name FROM {source}.teams')
+                names.update(cursor.fetchall())
+                cursor.execute(f'SELECT team_id, username FROM {source}.team_members ORDER BY team_id, position')
+                for team_id, username in cursor.fetchall():
+                    rosters.setdefault(team_id, []).append(username)
+
+            cursor.execute(' UNION ALL '.join(
+                f"SELECT coalesce(result_seq, id), winner_id, CASE WHEN winner_id = team_a_id THEN team_b_id ELSE team_a_id END FROM {source}.matches WHERE status = 'completed'"
+                for source in sources
+            ) + ' ORDER BY 1')
+
+            current = {}
+            totals = {}
+            replayed = 0
+            for _, winner_id, loser_id in cursor.fetchall():
+                if winner_id not in names or loser_id not in names:
+                    continue
+                changes = ratings.rate_match(
+                    current,
+                    (names[winner_id], rosters.get(winner_id, [])),
+                    (names[loser_id], rosters.get(loser_id, []))
                 )
-        
-        conn.commit()
-        conn.close()
+                for key, (rating, name, won) in changes.items():
+                    current[key] = rating
+                    _, games, wins = totals.get(key, (name, 0, 0))
+                    totals[key] = (name, games + 1, wins + won)
+                replayed += 1
 
-    def get_current_matches(self, tournament_id, round_number=None):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        if round_number:
-            cursor.execute(
-                'SELECT * FROM matches WHERE tournament_id = ? AND round_number = ? AND status = "pending"',
-                (tournament_id, round_number)
+            cursor.execute('DELETE FROM ratings')
+            cursor.executemany(
+                'INSERT INTO ratings (kind, key, name, rating, games, wins) VALUES (?, ?, ?, ?, ?, ?)',
+                [(*key, name, current[key], games, wins) for key, (name, games, wins) in totals.items()]
             )
-        else:
+            return replayed
+
+    def get_leaderboard(self, kind='team', limit=None):
+        # Top of the leaderboard: (name, rating, games, wins), read in index
+        # order
+        with self.cursor() as cursor:
             cursor.execute(
-                'SELECT * FROM matches WHERE tournament_id = ? AND status = "pending"',
-                (tournament_id,)
+                'SELECT name, rating, games, wins FROM ratings WHERE kind = ? ORDER BY rating DESC LIMIT ?',
+                (kind, limit or self.page_size)
             )
-        
-        results = cursor.fetchall()
-        conn.close()
-        return results
+            return cursor.fetchall()
+
+    def get_standings(self, tournament_id):
+        # Ranked by the tournament format's tiebreaks
+        with self.cursor() as cursor:
+            cursor.execute('SELECT bracket_data FROM tournaments WHERE id = ?', (tournament_id,))
+            row = cursor.fetchone()
+            if not row or not row[0]:
+                return []
+            bracket = json.loads(row[0])
+            if bracket['format'] in formats.LEAGUE_FORMATS:
+                self.fetch_history(cursor, tournament_id, bracket)
+            return formats.rank(bracket, self.fetch_standings(cursor, tournament_id))
 
     def set_match_winner(self, match_id, winner_id):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            'UPDATE matches SET winner_id = ?, status = "completed" WHERE id = ?',
-            (winner_id, match_id)
-        )
-        
-        conn.commit()
-        conn.close()
-
-    def create_next_round(self, tournament_id, current_round):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Get winners from current round
-        cursor.execute(
-            'SELECT winner_id FROM matches WHERE tournament_id = ? AND round_number = ? AND status = "completed"',
-            (tournament_id, current_round)
-        )
-        winners = [row[0] for row in cursor.fetchall()]
-        
-        # Create next round matches
-        next_round = current_round + 1
-        for i in range(0, len(winners), 2):
-            if i + 1 < len(winners):
+        # Record a result, move the teams on and update the standings.
+        # Returns (tournament_id, champion_id), or None if the match isn't
+        # open.
+        with self.cursor(write=True) as cursor:
+            cursor.execute(f'SELECT tournament_id, {MATCH_COLUMNS} FROM matches WHERE id = ?', (match_id,))
+            row = cursor.fetchone()
+            if not row:
+                return None
+            tournament_id, match = row[0], match_from_row(row[1:])
+
+            cursor.execute('SELECT bracket_data FROM tournaments WHERE id = ?', (tournament_id,))
+            bracket_data = cursor.fetchone()[0]
+            if not bracket_data:
+                return None
+            bracket = self.load_bracket(cursor, tournament_id, bracket_data)
+            index = match_index(bracket, match['round'], match['number'])
+            bracket['matches'][index] = match
+
+            # Only the two teams' wins and the winner's earlier opponents
+            # are needed for the Buchholz deltas
+            teams = [team for team in match['teams'] if team]
+            cursor.execute(
+                f'SELECT team_id, wins FROM standings WHERE tournament_id = ? AND team_id IN ({", ".join("?" * len(teams))})',
+                (tournament_id, *teams)
+            )
+            wins = dict(cursor.fetchall())
+            if bracket['format'] in formats.LEAGUE_FORMATS:
+                bracket['opponents'] = {str(winner_id): self.fetch_opponents(cursor, winner_id)}
+                bracket['beaten'] = {}
+            try:
+                changed, deltas = formats.apply_result(bracket, index, winner_id, wins)
+            except ValueError:
+                return None
+            self.apply_standings(cursor, tournament_id, deltas)
+            team_a, team_b = teams
+            self.apply_ratings(cursor, winner_id, team_b if winner_id == team_a else team_a)
+
+            for index in dict.fromkeys(changed):
+                match = bracket['matches'][index]
+                team_a, team_b = (team or None for team in match['teams'])
+                cursor.execute(
+                    'UPDATE matches SET team_a_id = ?, team_b_id = ?, winner_id = ?, status = ?, bye_slots = ? WHERE id = ?',
+                    (team_a, team_b, match['winner'] or None, match_status(match), bye_slots(match), match['id'])
+                )
+
+            # Number the result, so the ratings backfill replays results in
+            # the order they came in rather than in match order
+            cursor.execute("UPDATE sequences SET value = value + 1 WHERE name = 'results' RETURNING value")
+            cursor.execute('UPDATE matches SET result_seq = ? WHERE id = ?', (cursor.fetchone()[0], match_id))
+
+            # A finished swiss round is followed by the next one, paired
+            # from the standings as they are now
+            if formats.needs_pairing(bracket):
+                self.fetch_history(cursor, tournament_id, bracket)
+                standings = formats.rank(bracket, self.fetch_standings(cursor, tournament_id))
+                indexes, deltas = formats.pair_swiss_round(bracket, standings)
+                self.insert_matches(cursor, tournament_id, bracket, indexes)
+                self.apply_standings(cursor, tournament_id, deltas)
+            elif formats.finished(bracket):
+                self.fetch_history(cursor, tournament_id, bracket)
+                bracket['champion'] = formats.rank(bracket, self.fetch_standings(cursor, tournament_id))[0].team_id
+
+            if bracket['champion']:
                 cursor.execute(
-                    'INSERT INTO matches (tournament_id, round_number, match_number, team_a_id, team_b_id) VALUES (?, ?, ?, ?, ?)',
-                    (tournament_id, next_round, (i//2)+1, winners[i], winners[i+1])
+                    "UPDATE tournaments SET bracket_data = ?, bracket_version = bracket_version + 1, status = 'completed', completed_at = CURRENT_TIMESTAMP WHERE id = ?",
+                    (self.dump_bracket(bracket), tournament_id)
                 )
-        
-        conn.commit()
-        conn.close()
+            else:
+                cursor.execute(
+                    'UPDATE tournaments SET bracket_data = ?, bracket_version = bracket_version + 1 WHERE id = ?',
+                    (self.dump_bracket(bracket), tournament_id)
+                )
+            self.invalidate_tournament(tournament_id)
+            return tournament_id, bracket['champion']
+
+    def subscribe_bracket(self, tournament_id, chat_id, message_id, content_hash):
+        # The chat's live bracket message, current as of this version
+        with self.cursor(write=True) as cursor:
+            cursor.execute(
+                '''
+                INSERT OR REPLACE INTO bracket_subscriptions (tournament_id, chat_id, message_id, version, content_hash)
+                SELECT id, ?, ?, bracket_version, ? FROM tournaments WHERE id = ?
+                ''',
+                (chat_id, message_id, content_hash, tournament_id)
+            )
+
+    def get_bracket_subscription(self, tournament_id, chat_id):
+        # Message id of the chat's live bracket, or None
+        with self.cursor() as cursor:
+            cursor.execute(
+                'SELECT message_id FROM bracket_subscriptions WHERE tournament_id = ? AND chat_id = ?',
+                (tournament_id, chat_id)
+            )
+            row = cursor.fetchone()
+            return row[0] if row else None
+
+    def get_stale_subscriptions(self, tournament_id):
+        # (chat_id, message_id, content_hash, current version) for every
+        # live message behind the bracket
+        with self.cursor() as cursor:
+            cursor.execute(
+                '''
+                SELECT s.chat_id, s.message_id, s.content_hash, t.bracket_version
+                FROM bracket_subscriptions s JOIN tournaments t ON t.id = s.tournament_id
+                WHERE s.tournament_id = ? AND s.version < t.bracket_version
+                ''',
+                (tournament_id,)
+            )
+            return cursor.fetchall()
+
+    def update_subscription(self, tournament_id, chat_id, content_hash, version):
+        with self.cursor(write=True) as cursor:
+            cursor.execute(
+                'UPDATE bracket_subscriptions SET content_hash = ?, version = ? WHERE tournament_id = ? AND chat_id = ?',
+                (content_hash, version, tournament_id, chat_id)
+            )
+
+    def unsubscribe_bracket(self, tournament_id, chat_id):
+        with self.cursor(write=True) as cursor:
+            cursor.execute(
+                'DELETE FROM bracket_subscriptions WHERE tournament_id = ? AND chat_id = ?',
+                (tournament_id, chat_id)
+            )
 
     def delete_tournament(self, tournament_id):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Delete matches
-        cursor.execute('DELETE FROM matches WHERE tournament_id = ?', (tournament_id,))
-        # Delete teams
-        cursor.execute('DELETE FROM teams WHERE tournament_id = ?', (tournament_id,))
-        # Delete tournament
-        cursor.execute('DELETE FROM tournaments WHERE id = ?', (tournament_id,))
-        
-        conn.commit()
-        conn.close()
+        with self.cursor(write=True) as cursor:
+            # Delete matches, standings and live bracket subscriptions
+            cursor.execute('DELETE FROM matches WHERE tournament_id = ?', (tournament_id,))
+            cursor.execute('DELETE FROM standings WHERE tournament_id = ?', (tournament_id,))
+            cursor.execute('DELETE FROM bracket_subscriptions WHERE tournament_id = ?', (tournament_id,))
+            # Delete rosters and photos
+            cursor.execute('DELETE FROM team_members WHERE team_id IN (SELECT id FROM teams WHERE tournament_id = ?)', (tournament_id,))
+            cursor.execute('DELETE FROM team_photos WHERE team_id IN (SELECT id FROM teams WHERE tournament_id = ?)', (tournament_id,))
+            # Delete teams
+            cursor.execute('DELETE FROM teams WHERE tournament_id = ?', (tournament_id,))
+            # Delete tournament
+            cursor.execute('DELETE FROM tournaments WHERE id = ?', (tournament_id,))
+            self.invalidate_tournament(tournament_id)
 
     def delete_team(self, team_id):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Get tournament_id before deletion
-        cursor.execute('SELECT tournament_id FROM teams WHERE id = ?', (team_id,))
-        result = cursor.fetchone()
-        tournament_id = result[0] if result else None
-        
-        # Delete team
-        cursor.execute('DELETE FROM teams WHERE id = ?', (team_id,))
-        
-        # Update team count
-        if tournament_id:
+        with self.cursor(write=True) as cursor:
+            # Get tournament_id before deletion
+            cursor.execute('SELECT tournament_id FROM teams WHERE id = ?', (team_id,))
+            result = cursor.fetchone()
+            if not result:
+                return False
+            tournament_id = result[0]
+
+            # Delete team and free its slot in the same transaction
+            cursor.execute('DELETE FROM team_members WHERE team_id = ?', (team_id,))
+            cursor.execute('DELETE FROM team_photos WHERE team_id = ?', (team_id,))
+            cursor.execute('DELETE FROM teams WHERE id = ?', (team_id,))
             cursor.execute(
-                'UPDATE tournaments SET current_teams = current_teams - 1 WHERE id = ?',
+                'UPDATE tournaments SET current_teams = current_teams - 1 WHERE id = ? AND current_teams > 0',
                 (tournament_id,)
             )
-        
-        conn.commit()
-        conn.close()
+            self.invalidate_tournament(tournament_id)
+            return True
+
+    def archive_completed(self, after_days=7, limit=50):
+        # Move up to limit tournaments completed more than after_days ago,
+        # with their teams and matches, into the archive. Returns how many
+        # were moved.
+        if not self.archive_path:
+            return 0
+
+        # With WAL a transaction is only atomic per database file, so the
+        # copy and the delete commit separately. The copy replaces rows, so
+        # a run interrupted in between is simply repeated by the next one.
+        with self.cursor(write=True) as cursor:
+            cursor.execute(
+                "SELECT id FROM tournaments WHERE status = 'completed' AND completed_at <= datetime('now', ?) ORDER BY id LIMIT ?",
+                (f'-{after_days} days', limit)
+            )
+            ids = json.dumps([row[0] for row in cursor.fetchall()])
+            if ids == '[]':
+                return 0
+
+            cursor.execute(
+                '''
+                INSERT OR REPLACE INTO archive.tournaments (id, name, max_teams, current_teams, status, created_at, completed_at, bracket_data)
+                SELECT id, name, max_teams, current_teams, status, created_at, completed_at, bracket_data
+                FROM main.tournaments WHERE id IN (SELECT value FROM json_each(?))
+                ''',
+                (ids,)
+            )
+            cursor.execute(
+                '''
+                INSERT OR REPLACE INTO archive.teams (id, tournament_id, name, leader_username, registered_at)
+                SELECT id, tournament_id, name, leader_username, registered_at
+                FROM main.teams WHERE tournament_id IN (SELECT value FROM json_each(?))
+                ''',
+                (ids,)
+            )
+            for table in ('team_members', 'team_photos'):
+                cursor.execute(
+                    f'INSERT OR REPLACE INTO archive.{table} SELECT * FROM main.{table} WHERE team_id IN '
+                    '(SELECT id FROM main.teams WHERE tournament_id IN (SELECT value FROM json_each(?)))',
+                    (ids,)
+                )
+            cursor.execute(
+                '''
+                INSERT OR REPLACE INTO archive.matches (id, tournament_id, round_number, match_number, team_a_id, team_b_id, winner_id, status, result_seq)
+                SELECT id, tournament_id, round_number, match_number, team_a_id, team_b_id, winner_id, status, result_seq
+                FROM main.matches WHERE tournament_id IN (SELECT value FROM json_each(?))
+                ''',
+                (ids,)
+            )
+            cursor.execute(
+                'INSERT OR REPLACE INTO archive.standings SELECT * FROM main.standings WHERE tournament_id IN (SELECT value FROM json_each(?))',
+                (ids,)
+            )
+            cursor.execute(
+                '''
+                INSERT OR REPLACE INTO archive.teams_fts (rowid, name, leader_username, roster)
+                SELECT rowid, name, leader_username, roster FROM main.teams_fts
+                WHERE rowid IN (SELECT id FROM main.teams WHERE tournament_id IN (SELECT value FROM json_each(?)))
+                ''',
+                (ids,)
+            )
+
+        with self.cursor(write=True) as cursor:
+            cursor.execute('DELETE FROM main.matches WHERE tournament_id IN (SELECT value FROM json_each(?))', (ids,))
+            cursor.execute('DELETE FROM main.standings WHERE tournament_id IN (SELECT value FROM json_each(?))', (ids,))
+            cursor.execute('DELETE FROM main.bracket_subscriptions WHERE tournament_id IN (SELECT value FROM json_each(?))', (ids,))
+            for table in ('team_members', 'team_photos'):
+                cursor.execute(
+                    f'DELETE FROM main.{table} WHERE team_id IN '
+                    '(SELECT id FROM main.teams WHERE tournament_id IN (SELECT value FROM json_each(?)))',
+                    (ids,)
+                )
+            cursor.execute('DELETE FROM main.teams WHERE tournament_id IN (SELECT value FROM json_each(?))', (ids,))
+            cursor.execute('DELETE FROM main.tournaments WHERE id IN (SELECT value FROM json_each(?))', (ids,))
+
+        archived = json.loads(ids)
+        for tournament_id in archived:
+            self.invalidate_tournament(tournament_id)
+        return len(archived)
+
+    def get_archived_tournaments(self, after_id=None, before_id=None, limit=None):
+        # Finished tournaments with their champion's name
+        if not self.archive_path:
+            return Page([], False, False)
+        return self.fetch_page(
+            '''
+            SELECT t.id, t.name, t.current_teams, t.completed_at,
+                   (SELECT name FROM archive.teams WHERE id = json_extract(t.bracket_data, '$.champion'))
+            FROM archive.tournaments t WHERE t.status = 'completed'
+            ''',
+            (), after_id, before_id, limit or self.page_size
+        )
+
+    def search_teams(self, text, limit=None):
+        # Teams whose name, leader or players start with every word of text,
+        # best match first; live tournaments come before archived ones
+        words = re.findall(r'\w+', text)
+        if not words:
+            return []
+        # Each word is quoted so FTS5 operators in the input stay literal
+        expression = ' '.join(f'"{word}"*' for word in words)
+        weights = ', '.join(map(str, TEAMS_FTS_WEIGHTS))
+        sources = ['main'] + (['archive'] if self.archive_path else [])
+        with self.cursor() as cursor:
+            cursor.execute(
+                ' UNION ALL '.join(
+                    f'''
+                    SELECT t.id, t.tournament_id, tr.name, t.name, t.leader_username, {archived} AS archived, bm25(f.teams_fts, {weights}) AS score
+                    FROM {source}.teams_fts f
+                    JOIN {source}.teams t ON t.id = f.rowid
+                    JOIN {source}.tournaments tr ON tr.id = t.tournament_id
+                    WHERE f.teams_fts MATCH ?
+                    '''
+                    for archived, source in enumerate(sources)
+                ) + ' ORDER BY archived, score LIMIT ?',
+                (*[expression] * len(sources), limit or self.page_size)
+            )
+            return [SearchResult(*row[:5], bool(row[5])) for row in cursor.fetchall()]
+
+    def incremental_vacuum(self, pages=1000):
+        # Return up to pages free pages to the file system; returns how many
+        # were released. Runs outside a transaction, as VACUUM requires.
+        with self.lock:
+            if self.conn.execute('PRAGMA main.auto_vacuum').fetchone()[0] != 2:
+                # Files created before auto_vacuum was set need one full
+                # VACUUM to switch to incremental mode
+                self.conn.execute('PRAGMA main.auto_vacuum = INCREMENTAL')
+                self.conn.execute('VACUUM main')
+            free = self.conn.execute('PRAGMA main.freelist_count').fetchone()[0]
+            self.conn.execute(f'PRAGMA main.incremental_vacuum({int(pages)})').fetchall()
+            return free - self.conn.execute('PRAGMA main.freelist_count').fetchone()[0]
+
+class AsyncDatabase:
+    # Awaitable facade over Database. Every call is queued to one dedicated
+    # thread, so a slow write never blocks the event loop and calls still
+    # run in the order they were issued.
+    def __init__(self, database, executor=None):
+        self.database = database
+        self.executor = executor or ThreadPoolExecutor(max_workers=1, thread_name_prefix='database')
+
+    def __getattr__(self, name):
+        method = getattr(self.database, name)
+        if not callable(method):
+            return method
+
+        async def call(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self.executor, functools.partial(method, *args, **kwargs)
+            )
+
+        # Cache the wrapper so later lookups skip __getattr__
+        setattr(self, name, call)
+        return call
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.database.close()
@@ -0,0 +1,266 @@
+# Tournament formats beyond single elimination, built on the bracket engine
+# in bracket.py. Every format is a bracket dict with a 'format' key:
+#
+#   double_elimination  the single elimination tree plus a losers bracket;
+#                       losers drop in through 'loser_next' and the losers
+#                       bracket winner meets the winners bracket winner in
+#                       a single grand final
+#   round_robin         every team plays every other once; all rounds are
+#                       created up front with the circle method
+#   swiss               a fixed number of rounds, each paired once the one
+#                       before it is finished, top of the standings against
+#                       each other and never the same two teams twice
+#
+# Round robin and swiss brackets also carry:
+#
+#   'remaining': results still to come in the open rounds
+#   'opponents': {team id: [team ids played]}   (keys are strings)
+#   'beaten':    {team id: [team ids beaten]}
+#   'byes':      [team ids given a bye]         (swiss only)
+#
+# The first three follow from the match results, and the database fills in
+# only what a call needs: the winner's opponents to record a result, every
+# team's for pairing and ranking.
+#
+# Standings (wins, losses and Buchholz, the sum of the opponents' wins) are
+# stored per team and changed by deltas as results come in; nothing is
+# recomputed from the full match list.
+
+from itertools import groupby
+from bracket import BYE, build_single_elimination, new_bracket, new_match, record_result, resolve_byes, resolve_first_round
+
+FORMATS = {
+    'single_elimination': "Single elimination",
+    'double_elimination': "Double elimination",
+    'round_robin': "Round robin",
+    'swiss': "Swiss",
+}
+
+# Formats decided by standings rather than by a final
+LEAGUE_FORMATS = ('round_robin', 'swiss')
+
+# Pairing attempts before a swiss round accepts a rematch
+PAIRING_BUDGET = 10000
+
+def build(bracket_format, team_ids, layout='standard', seed=None):
+    if bracket_format == 'single_elimination':
+        return build_single_elimination(team_ids, layout, seed)
+    if bracket_format == 'double_elimination':
+        return build_double_elimination(team_ids, layout, seed)
+    if bracket_format == 'round_robin':
+        return build_round_robin(team_ids)
+    if bracket_format == 'swiss':
+        return build_swiss(team_ids)
+    raise ValueError(f"Unknown tournament format: {bracket_format}")
+
+def add_round(bracket, count):
+    # Append a round of count matches; returns their indexes
+    matches = bracket['matches']
+    bracket['offsets'].append(len(matches))
+    round_number = len(bracket['offsets'])
+    for match_number in range(1, count + 1):
+        matches.append(new_match(round_number, match_number))
+    bracket['rounds'] = round_number
+    return list(range(len(matches) - count, len(matches)))
+
+def build_double_elimination(team_ids, layout='standard', seed=None):
+    bracket = new_bracket('double_elimination', team_ids, layout, seed)
+    matches = bracket['matches']
+    offsets = bracket['offsets']
+    winner_rounds = len(offsets)
+    size = 2 ** winner_rounds
+
+    # Losers bracket: odd rounds pair up the survivors, even rounds meet the
+    # teams dropping from the next winners round (in reverse order, which
+    # keeps early rematches apart)
+    previous = []
+    for losers_round in range(1, 2 * (winner_rounds - 1) + 1):
+        if losers_round == 1:
+            current = add_round(bracket, size // 4)
+            for number in range(size // 2):
+                matches[offsets[0] + number]['loser_next'] = [current[number // 2], number % 2]
+        elif losers_round % 2 == 0:
+            current = add_round(bracket, len(previous))
+            for number, index in enumerate(previous):
+                matches[index]['next'] = [current[number], 0]
+            dropping = offsets[losers_round // 2]
+            for number in range(len(current)):
+                matches[dropping + number]['loser_next'] = [current[-1 - number], 1]
+        else:
+            current = add_round(bracket, len(previous) // 2)
+            for number, index in enumerate(previous):
+                matches[index]['next'] = [current[number // 2], number % 2]
+        previous = current
+
+    final = add_round(bracket, 1)[0]
+    winners_final = offsets[winner_rounds - 1]
+    matches[winners_final]['next'] = [final, 0]
+    if previous:
+        matches[previous[0]]['next'] = [final, 1]
+    else:
+        matches[winners_final]['loser_next'] = [final, 1]
+
+    resolve_first_round(bracket)
+    return bracket
+
+def new_league(bracket_format, team_ids):
+    if len(team_ids) < 2:
+        raise ValueError("At least two teams are needed for a bracket")
+    return {
+        'format': bracket_format,
+        'rounds': 0,
+        'offsets': [],
+        'matches': [],
+        'champion': None,
+        'remaining': 0,
+        'opponents': {},
+        'beaten': {},
+    }
+
+def build_round_robin(team_ids):
+    bracket = new_league('round_robin', team_ids)
+
+    # Circle method: the first team stays put and the rest rotate, giving
+    # every pairing exactly once. An odd field gets a BYE, whose pairings
+    # are left out.
+    teams = list(team_ids) + ([BYE] if len(team_ids) % 2 else [])
+    half = len(teams) // 2
+    for _ in range(len(teams) - 1):
+        pairs = [(teams[i], teams[-1 - i]) for i in range(half) if BYE not in (teams[i], teams[-1 - i])]
+        for index, pair in zip(add_round(bracket, len(pairs)), pairs):
+            bracket['matches'][index]['teams'] = list(pair)
+        teams = [teams[0], teams[-1]] + teams[1:-1]
+
+    bracket['remaining'] = len(bracket['matches'])
+    return bracket
+
+def build_swiss(team_ids, rounds=None):
+    bracket = new_league('swiss', team_ids)
+    bracket['swiss_rounds'] = rounds or (len(team_ids) - 1).bit_length()
+    bracket['byes'] = []
+
+    # Round one splits the seeds: 1 v n/2 + 1, 2 v n/2 + 2, ...; an odd
+    # field gives the bye to the lowest seed
+    teams = list(team_ids)
+    bye = teams.pop() if len(teams) % 2 else None
+    half = len(teams) // 2
+    add_swiss_round(bracket, [(teams[i], teams[half + i]) for i in range(half)], bye)
+    return bracket
+
+def add_swiss_round(bracket, pairs, bye):
+    # Returns the indexes of the new matches; a bye is resolved at once
+    indexes = add_round(bracket, len(pairs) + (1 if bye else 0))
+    for index, pair in zip(indexes, pairs):
+        bracket['matches'][index]['teams'] = list(pair)
+    if bye:
+        bracket['matches'][indexes[-1]]['teams'] = [bye, BYE]
+        bracket['byes'].append(bye)
+        resolve_byes(bracket, indexes[-1])
+    bracket['remaining'] = len(pairs)
+    return indexes
+
+def needs_pairing(bracket):
+    return bracket['format'] == 'swiss' and bracket['remaining'] == 0 and bracket['rounds'] < bracket['swiss_rounds']
+
+def finished(bracket):
+    if bracket['format'] not in LEAGUE_FORMATS or bracket['remaining']:
+        return False
+    return bracket['format'] == 'round_robin' or bracket['rounds'] >= bracket['swiss_rounds']
+
+def pair_swiss_round(bracket, standings):
+    # Pair the next round from the ranked standings. Returns (indexes of
+    # the new matches, standings deltas for a bye).
+    opponents = bracket['opponents']
+    teams = [standing.team_id for standing in standings]
+
+    bye = None
+    if len(teams) % 2:
+        # The lowest ranked team that has not had a bye sits out
+        bye = next((team for team in reversed(teams) if team not in bracket['byes']), teams[-1])
+        teams.remove(bye)
+
+    pairs = pair_without_rematches(teams, opponents)
+    if pairs is None:
+        # Small fields run out of fresh pairings; fall back to pairing by rank
+        pairs = [(teams[i], teams[i + 1]) for i in range(0, len(teams), 2)]
+
+    deltas = result_deltas(bracket, bye, BYE, {}) if bye else []
+    return add_swiss_round(bracket, pairs, bye), deltas
+
+def pair_without_rematches(teams, opponents):
+    # Depth-first: the best ranked unpaired team takes the best ranked
+    # partner it hasn't met, backing up when the rest can't be paired
+    budget = [PAIRING_BUDGET]
+
+    def pair(remaining):
+        if not remaining:
+            return []
+        budget[0] -= 1
+        if budget[0] < 0:
+            return None
+        first, rest = remaining[0], remaining[1:]
+        played = opponents.get(str(first), [])
+        for i, partner in enumerate(rest):
+            if partner in played:
+                continue
+            paired = pair(rest[:i] + rest[i + 1:])
+            if paired is not None:
+                return [(first, partner)] + paired
+        return None
+
+    return pair(teams)
+
+def apply_result(bracket, index, winner_id, wins):
+    # Record a result. wins holds the current wins of both teams. Returns
+    # (indexes of changed matches, standings deltas).
+    changed = record_result(bracket, index, winner_id)
+    team_a, team_b = bracket['matches'][index]['teams']
+    deltas = result_deltas(bracket, winner_id, team_b if winner_id == team_a else team_a, wins)
+    if bracket['format'] in LEAGUE_FORMATS:
+        bracket['remaining'] -= 1
+    return changed, deltas
+
+def result_deltas(bracket, winner_id, loser_id, wins):
+    # (team_id, wins, losses, buchholz) changes for one result. A loser of
+    # BYE is a swiss bye, which counts as a win without an opponent.
+    if bracket['format'] not in LEAGUE_FORMATS:
+        return [(winner_id, 1, 0, 0), (loser_id, 0, 1, 0)]
+
+    opponents = bracket['opponents']
+    winner_key = str(winner_id)
+
+    # The winner's earlier opponents each gain a point of Buchholz
+    deltas = [(winner_id, 1, 0, 0)]
+    deltas += [(opponent, 0, 0, 1) for opponent in opponents.get(winner_key, [])]
+
+    if loser_id != BYE:
+        loser_key = str(loser_id)
+        deltas += [
+            (winner_id, 0, 0, wins.get(loser_id, 0)),
+            (loser_id, 0, 1, wins.get(winner_id, 0) + 1),
+        ]
+        opponents.setdefault(winner_key, []).append(loser_id)
+        opponents.setdefault(loser_key, []).append(winner_id)
+        bracket['beaten'].setdefault(winner_key, []).append(loser_id)
+    return deltas
+
+def rank(bracket, standings):
+    # Order standings by wins, then the format's tiebreaks: head-to-head
+    # among the tied teams before Buchholz in round robin, after it in swiss
+    beaten = bracket.get('beaten', {})
+    head_to_head_first = bracket['format'] == 'round_robin'
+
+    ranked = []
+    by_wins = sorted(standings, key=lambda standing: -standing.wins)
+    for _, group in groupby(by_wins, key=lambda standing: standing.wins):
+        group = list(group)
+        tied = {standing.team_id for standing in group}
+
+        def tiebreak(standing):
+            head_to_head = sum(1 for team in beaten.get(str(standing.team_id), []) if team in tied)
+            if head_to_head_first:
+                return (-head_to_head, -standing.buchholz, standing.team_id)
+            return (-standing.buchholz, -head_to_head, standing.team_id)
+
+        ranked += sorted(group, key=tiebreak)
+    return ranked
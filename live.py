@@ -0,0 +1,95 @@
+import asyncio
+import hashlib
+import logging
+from telegram.error import BadRequest, RetryAfter, TelegramError
+
+logger = logging.getLogger(__name__)
+
+def content_hash(text):
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+class LiveBrackets:
+    # Keeps one pinned bracket message per chat following a tournament and
+    # edits it in place when the bracket changes. Results that arrive within
+    # the debounce window are folded into one refresh, only subscriptions
+    # behind the bracket version are looked at, and an edit is skipped when
+    # the rendered text hashes the same as what the message already shows.
+    def __init__(self, db, render, debounce=2.0):
+        self.db = db
+        self.render = render
+        self.debounce = debounce
+        self.bot = None
+        self.pending = {}
+        self.tasks = set()
+
+    def start(self, bot):
+        self.bot = bot
+
+    async def stop(self):
+        # Bring every live message up to date before shutting down
+        for tournament_id, handle in list(self.pending.items()):
+            handle.cancel()
+            self.run(tournament_id)
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    async def follow(self, tournament_id, message, text):
+        await self.db.subscribe_bracket(tournament_id, message.chat_id, message.message_id, content_hash(text))
+        try:
+            await message.pin(disable_notification=True)
+        except TelegramError as e:
+            # Groups may not let the bot pin; the message still updates
+            logger.info(f"Could not pin bracket in {message.chat_id}: {e}")
+
+    async def show(self, tournament_id, chat_id, message_id, text):
+        # Bring a followed message up to text. Returns False, dropping the
+        # subscription, when the message has been deleted.
+        try:
+            await self.bot.edit_message_text(text, chat_id, message_id)
+        except BadRequest as e:
+            if 'not modified' not in str(e):
+                logger.info(f"Dropping live bracket in {chat_id}: {e}")
+                await self.db.unsubscribe_bracket(tournament_id, chat_id)
+                return False
+        except TelegramError as e:
+            # Most likely still there; the next refresh tries again
+            logger.error(f"Failed to update live bracket in {chat_id}: {e}")
+            return True
+        await self.db.subscribe_bracket(tournament_id, chat_id, message_id, content_hash(text))
+        return True
+
+    def schedule(self, tournament_id):
+        if tournament_id not in self.pending:
+            self.pending[tournament_id] = asyncio.get_running_loop().call_later(self.debounce, self.run, tournament_id)
+
+    def run(self, tournament_id):
+        self.pending.pop(tournament_id, None)
+        task = asyncio.create_task(self.refresh(tournament_id))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def refresh(self, tournament_id):
+        subscriptions = await self.db.get_stale_subscriptions(tournament_id)
+        if not subscriptions:
+            return
+
+        text = self.render(await self.db.get_bracket(tournament_id))
+        digest = content_hash(text)
+        for chat_id, message_id, shown, version in subscriptions:
+            if shown != digest:
+                try:
+                    await self.bot.edit_message_text(text, chat_id, message_id)
+                except RetryAfter as e:
+                    # Left stale and picked up again by the next refresh
+                    await asyncio.sleep(e.retry_after)
+                    self.schedule(tournament_id)
+                    continue
+                except BadRequest as e:
+                    if 'not modified' not in str(e):
+                        # The message was deleted or can't be edited any more
+                        logger.info(f"Dropping live bracket in {chat_id}: {e}")
+                        await self.db.unsubscribe_bracket(tournament_id, chat_id)
+                        continue
+                except TelegramError as e:
+                    logger.error(f"Failed to update live bracket in {chat_id}: {e}")
+                    continue
+            await self.db.update_subscription(tournament_id, chat_id, digest, version)
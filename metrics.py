@@ -0,0 +1,149 @@
+import bisect
+import functools
+import inspect
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from telegram.request import HTTPXRequest
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class NullSink:
+    # Default sink; metrics cost nothing until a real sink is installed
+    def observe(self, name, labels, seconds):
+        pass
+
+    def increment(self, name, labels=(), value=1):
+        pass
+
+class PrometheusSink:
+    # Keeps latency histograms and counters in memory and renders them in
+    # the Prometheus text exposition format
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+
+    def observe(self, name, labels, seconds):
+        with self.lock:
+            histogram = self.histograms.get((name, labels))
+            if histogram is None:
+                histogram = self.histograms[(name, labels)] = [[0] * (len(self.buckets) + 1), 0.0]
+            histogram[0][bisect.bisect_left(self.buckets, seconds)] += 1
+            histogram[1] += seconds
+
+    def increment(self, name, labels=(), value=1):
+        with self.lock:
+            self.counters[(name, labels)] = self.counters.get((name, labels), 0) + value
+
+    def register_gauge(self, name, read):
+        # read() is called at scrape time, e.g. to report cache counters
+        self.gauges[name] = read
+
+    def render(self):
+        lines = []
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+
+        for (name, labels), (counts, total) in histograms:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{format_labels(labels + (("le", bound),))} {cumulative}')
+            lines.append(f'{name}_sum{format_labels(labels)} {total}')
+            lines.append(f'{name}_count{format_labels(labels)} {cumulative}')
+        for (name, labels), value in counters:
+            lines.append(f'{name}{format_labels(labels)} {value}')
+        for name, read in sorted(self.gauges.items()):
+            lines.append(f'{name} {read()}')
+        return '\n'.join(lines) + '\n'
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+sink = NullSink()
+
+def set_sink(new_sink):
+    global sink
+    sink = new_sink
+
+def timed(func, metric, labels):
+    # Wrap a sync or async callable to record its latency and failures
+    errors = f'{metric}_errors_total'
+    histogram = f'{metric}_duration_seconds'
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                sink.increment(errors, labels)
+                raise
+            finally:
+                sink.observe(histogram, labels, time.perf_counter() - started)
+    else:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                sink.increment(errors, labels)
+                raise
+            finally:
+                sink.observe(histogram, labels, time.perf_counter() - started)
+    return wrapper
+
+def instrument(obj, metric, label, skip=()):
+    # Replace the public methods of obj with timed wrappers. Only called when
+    # metrics are enabled, so an uninstrumented bot pays no per-call cost.
+    for name, member in inspect.getmembers(type(obj), inspect.isfunction):
+        if name.startswith('_') or name in skip:
+            continue
+        setattr(obj, name, timed(getattr(obj, name), metric, ((label, name),)))
+
+class InstrumentedRequest(HTTPXRequest):
+    # Times every Bot API call, labelled by API method
+    async def do_request(self, url, method, *args, **kwargs):
+        labels = (('method', url.rsplit('/', 1)[-1]),)
+        started = time.perf_counter()
+        try:
+            return await super().do_request(url, method, *args, **kwargs)
+        except Exception:
+            sink.increment('telegram_api_errors_total', labels)
+            raise
+        finally:
+            sink.observe('telegram_api_duration_seconds', labels, time.perf_counter() - started)
+
+def serve(prometheus_sink, port, host='0.0.0.0'):
+    # Expose /metrics from a background thread
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            body = prometheus_sink.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    logger.info(f"Serving metrics on {host}:{port}/metrics")
+    return server
@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import time
+from telegram.error import RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Telegram allows roughly 30 messages/sec overall and 1/sec into one chat
+GLOBAL_RATE = 25
+PER_CHAT_RATE = 1
+MAX_RETRIES = 3
+MAX_MESSAGE_LENGTH = 4096
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class NotificationDispatcher:
+    # Delivers admin notifications from bounded queues in the background so
+    # handlers can reply to the user straight away. Each chat is pinned to one
+    # worker, which keeps its messages in order while other chats are sent
+    # concurrently. Sends stay within Telegram's flood limits and honour the
+    # retry_after of a 429. Bursts of digest messages for the same chat and
+    # topic are merged into one message; their media is only sent along when
+    # the digest holds a single entry.
+    def __init__(self, workers=4, queue_size=1000, digest_window=5.0):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.digest_window = digest_window
+        self.bot = None
+        self.queues = []
+        self.tasks = []
+        self.global_bucket = TokenBucket(GLOBAL_RATE)
+        self.chat_buckets = {}
+        self.digests = {}
+
+    def start(self, bot):
+        self.bot = bot
+        self.queues = [asyncio.Queue(maxsize=self.queue_size // self.workers) for _ in range(self.workers)]
+        self.tasks = [asyncio.create_task(self.worker(queue)) for queue in self.queues]
+
+    async def stop(self):
+        # Let queued notifications go out before shutting the workers down
+        for key in list(self.digests):
+            self.flush_digest(key)
+        for queue in self.queues:
+            await queue.join()
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    def enqueue(self, chat_id, method, *args):
+        queue = self.queues[hash(chat_id) % self.workers]
+        try:
+            queue.put_nowait((chat_id, method, args))
+        except asyncio.QueueFull:
+            logger.error(f"Notification queue full, dropping {method} to {chat_id}")
+
+    def send_message(self, chat_ids, text):
+        for chat_id in chat_ids:
+            self.enqueue(chat_id, 'send_message', text)
+
+    def send_media_group(self, chat_ids, media):
+        for chat_id in chat_ids:
+            self.enqueue(chat_id, 'send_media_group', media)
+
+    def send_digest(self, chat_ids, topic, text, media=None):
+        # The first entry for a (chat, topic) opens a collection window;
+        # everything that arrives before it closes goes out together
+        for chat_id in chat_ids:
+            key = (chat_id, topic)
+            if key not in self.digests:
+                self.digests[key] = []
+                asyncio.get_running_loop().call_later(self.digest_window, self.flush_digest, key)
+            self.digests[key].append((text, media))
+
+    def flush_digest(self, key):
+        chat_id, topic = key
+        entries = self.digests.pop(key, [])
+        if not entries:
+            return
+
+        if len(entries) == 1:
+            text, media = entries[0]
+            self.enqueue(chat_id, 'send_message', text)
+            if media:
+                self.enqueue(chat_id, 'send_media_group', media)
+        else:
+            # Text only, as an album per entry would undo the merge. Split
+            # across messages to stay under Telegram's length limit.
+            text = f"📬 {len(entries)} updates"
+            for entry_text, _ in entries:
+                if len(text) + len(entry_text) + 2 > MAX_MESSAGE_LENGTH:
+                    self.enqueue(chat_id, 'send_message', text)
+                    text = entry_text
+                else:
+                    text += "\n\n" + entry_text
+            self.enqueue(chat_id, 'send_message', text)
+
+    async def worker(self, queue):
+        while True:
+            chat_id, method, args = await queue.get()
+            try:
+                await self.deliver(chat_id, method, args)
+            except Exception as e:
+                logger.error(f"Failed to notify {chat_id}: {e}")
+            finally:
+                queue.task_done()
+
+    async def deliver(self, chat_id, method, args):
+        bucket = self.chat_buckets.setdefault(chat_id, TokenBucket(PER_CHAT_RATE, capacity=3))
+        for attempt in range(MAX_RETRIES + 1):
+            await bucket.acquire()
+            await self.global_bucket.acquire()
+            try:
+                return await getattr(self.bot, method)(chat_id, *args)
+            except RetryAfter as e:
+                if attempt == MAX_RETRIES:
+                    raise
+                logger.warning(f"Flood limit hit for {chat_id}, retrying in {e.retry_after}s")
+                await asyncio.sleep(e.retry_after)
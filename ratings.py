@@ -0,0 +1,45 @@
+# Elo ratings carried from one tournament to the next. A team is known by
+# its name and a player by their username, both compared case-insensitively,
+# so the same squad entering a new event keeps its rating.
+#
+# Ratings are keyed (kind, key) with kind 'team' or 'player'. A result
+# touches only the two teams and their rosters, so rating it is O(1).
+
+INITIAL_RATING = 1500.0
+K_FACTOR = 32
+
+def team_key(name):
+    return ('team', name.casefold())
+
+def player_key(username):
+    return ('player', username.lstrip('@').casefold())
+
+def expected(rating, opponent):
+    # Chance of rating beating opponent
+    return 1 / (1 + 10 ** ((opponent - rating) / 400))
+
+def rate_match(ratings, winner, loser, k=K_FACTOR):
+    # winner and loser are (team name, [usernames]); ratings maps keys to
+    # current ratings, missing keys starting at INITIAL_RATING. Returns
+    # {key: (new rating, display name, won)} for every key involved.
+    def current(key):
+        return ratings.get(key, INITIAL_RATING)
+
+    (winner_name, winner_roster), (loser_name, loser_roster) = winner, loser
+    changes = {}
+
+    winner_rating, loser_rating = current(team_key(winner_name)), current(team_key(loser_name))
+    change = k * (1 - expected(winner_rating, loser_rating))
+    changes[team_key(winner_name)] = (winner_rating + change, winner_name, 1)
+    changes[team_key(loser_name)] = (loser_rating - change, loser_name, 0)
+
+    # Players move by their side's result, each side rated as its average
+    if winner_roster and loser_roster:
+        winner_average = sum(current(player_key(player)) for player in winner_roster) / len(winner_roster)
+        loser_average = sum(current(player_key(player)) for player in loser_roster) / len(loser_roster)
+        change = k * (1 - expected(winner_average, loser_average))
+        for player in winner_roster:
+            changes[player_key(player)] = (current(player_key(player)) + change, player, 1)
+        for player in loser_roster:
+            changes[player_key(player)] = (current(player_key(player)) - change, player, 0)
+    return changes
@@ -0,0 +1,51 @@
+from collections import namedtuple
+
+# Callback payloads look like "<prefix><version>:<arg>:<arg>", e.g. "w1:12:7".
+# Prefixes are kept short to stay well inside Telegram's 64-byte limit.
+# Changing a route's arguments means bumping its version, which turns
+# buttons still showing the old layout into stale payloads instead of
+# misrouting them. Trailing optional arguments may be left off, so a
+# route can grow e.g. a page cursor without breaking existing buttons.
+Route = namedtuple('Route', 'name key arg_count optional')
+
+# Largest id accepted in a payload (SQLite INTEGER PRIMARY KEY range)
+MAX_ARG = 2 ** 63 - 1
+
+class CallbackRouter:
+    def __init__(self):
+        self.routes = {}
+        self.keys = {}
+
+    def register(self, name, prefix, arg_count=0, version=1, optional=0):
+        key = f"{prefix}{version}"
+        if key in self.keys:
+            raise ValueError(f"Callback key {key} is already used by {self.keys[key].name}")
+        route = Route(name, key, arg_count, optional)
+        self.keys[key] = route
+        self.routes[name] = route
+
+    def encode(self, name, *args):
+        route = self.routes[name]
+        if not route.arg_count - route.optional <= len(args) <= route.arg_count:
+            raise ValueError(f"{name} takes {route.arg_count} arguments, got {len(args)}")
+        return ":".join([route.key, *map(str, args)])
+
+    def decode(self, data):
+        # Returns (route, args), or None for unknown, stale or malformed data
+        key, _, rest = data.partition(":")
+        route = self.keys.get(key)
+        if route is None:
+            return None
+
+        parts = rest.split(":") if rest else []
+        if not route.arg_count - route.optional <= len(parts) <= route.arg_count:
+            return None
+        args = []
+        for part in parts:
+            if not (part.isascii() and part.isdigit()):
+                return None
+            value = int(part)
+            if value > MAX_ARG:
+                return None
+            args.append(value)
+        return route, args
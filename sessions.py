@@ -0,0 +1,150 @@
+import json
+import time
+from collections import OrderedDict
+
+class RegistrationSession:
+    # One user's progress through the multi-step team registration, or
+    # through creating a tournament (tournament_name set, no tournament_id)
+    # photo_keys holds the file_unique_id of each photo, to spot duplicates.
+    # version counts the saves; 0 is a session not saved yet.
+    __slots__ = ('user_id', 'tournament_id', 'step', 'team_name', 'leader_username', 'roster', 'photos', 'expires_at', 'photo_keys', 'tournament_name', 'version')
+
+    def __init__(self, user_id, tournament_id, step, team_name=None, leader_username=None, roster=None, photos=None, expires_at=0.0, photo_keys=None, tournament_name=None, version=0):
+        self.user_id = user_id
+        self.tournament_id = tournament_id
+        self.step = step
+        self.team_name = team_name
+        self.leader_username = leader_username
+        self.roster = roster or []
+        self.photos = photos or []
+        self.expires_at = expires_at
+        self.photo_keys = photo_keys or []
+        self.tournament_name = tournament_name
+        self.version = version
+
+    def copy(self):
+        return RegistrationSession(
+            self.user_id, self.tournament_id, self.step, self.team_name, self.leader_username, list(self.roster),
+            list(self.photos), self.expires_at, list(self.photo_keys), self.tournament_name, self.version
+        )
+
+# Every store saves and deletes by compare-and-swap on version: save() of a
+# session read before someone else saved or deleted it writes nothing and
+# returns False, as does delete(user_id, version) when the version has
+# moved on. A session with version 0 is new and replaces whatever the user
+# had. Callers read again and redo their step, or drop it.
+
+class MemorySessionStore:
+    # Sessions kept in process memory. Entries are ordered by last update,
+    # so expired ones are always at the front and purged in O(1) each.
+    # Callers get copies, so a session changes only through save().
+    def __init__(self, ttl=3600):
+        self.ttl = ttl
+        self.sessions = OrderedDict()
+
+    def get(self, user_id):
+        self.purge()
+        session = self.sessions.get(user_id)
+        return session.copy() if session else None
+
+    def save(self, session):
+        self.purge()
+        current = self.sessions.get(session.user_id)
+        if session.version and (current is None or current.version != session.version):
+            return False
+        session.version += 1
+        session.expires_at = time.time() + self.ttl
+        self.sessions[session.user_id] = session.copy()
+        self.sessions.move_to_end(session.user_id)
+        return True
+
+    def delete(self, user_id, version=None):
+        current = self.sessions.get(user_id)
+        if current is None or (version is not None and current.version != version):
+            return False
+        del self.sessions[user_id]
+        return True
+
+    def purge(self):
+        now = time.time()
+        purged = 0
+        while self.sessions:
+            user_id, session = next(iter(self.sessions.items()))
+            if session.expires_at > now:
+                break
+            del self.sessions[user_id]
+            purged += 1
+        return purged
+
+class SQLiteSessionStore:
+    # Sessions kept in the registration_sessions table, so they survive a
+    # restart and are shared by every process using the same database. The
+    # version check runs inside the write transaction, so it holds across
+    # processes.
+    def __init__(self, database, ttl=3600):
+        self.database = database
+        self.ttl = ttl
+
+    def get(self, user_id):
+        with self.database.cursor() as cursor:
+            cursor.execute(
+                'SELECT user_id, tournament_id, step, team_name, leader_username, roster, photos, expires_at, photo_keys, tournament_name, version FROM registration_sessions WHERE user_id = ? AND expires_at > ?',
+                (user_id, time.time())
+            )
+            row = cursor.fetchone()
+        if not row:
+            return None
+        return RegistrationSession(*row[:5], json.loads(row[5]), json.loads(row[6]), row[7], json.loads(row[8]), *row[9:])
+
+    def save(self, session):
+        now = time.time()
+        values = (
+            session.tournament_id, session.step, session.team_name, session.leader_username, json.dumps(session.roster),
+            json.dumps(session.photos), now + self.ttl, json.dumps(session.photo_keys), session.tournament_name
+        )
+        with self.database.cursor(write=True) as cursor:
+            if session.version:
+                cursor.execute(
+                    '''
+                    UPDATE registration_sessions SET tournament_id = ?, step = ?, team_name = ?, leader_username = ?, roster = ?,
+                        photos = ?, expires_at = ?, photo_keys = ?, tournament_name = ?, version = version + 1
+                    WHERE user_id = ? AND version = ? AND expires_at > ?
+                    ''',
+                    (*values, session.user_id, session.version, now)
+                )
+                if cursor.rowcount == 0:
+                    return False
+            else:
+                cursor.execute(
+                    '''
+                    INSERT OR REPLACE INTO registration_sessions
+                        (tournament_id, step, team_name, leader_username, roster, photos, expires_at, photo_keys, tournament_name, user_id, version)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1)
+                    ''',
+                    (*values, session.user_id)
+                )
+            # Abandoned sessions are swept on the expiry index as we go
+            cursor.execute('DELETE FROM registration_sessions WHERE expires_at <= ?', (now,))
+        session.version += 1
+        session.expires_at = values[6]
+        return True
+
+    def delete(self, user_id, version=None):
+        with self.database.cursor(write=True) as cursor:
+            if version is None:
+                cursor.execute('DELETE FROM registration_sessions WHERE user_id = ?', (user_id,))
+            else:
+                cursor.execute('DELETE FROM registration_sessions WHERE user_id = ? AND version = ?', (user_id, version))
+            return cursor.rowcount > 0
+
+    def purge(self):
+        with self.database.cursor(write=True) as cursor:
+            cursor.execute('DELETE FROM registration_sessions WHERE expires_at <= ?', (time.time(),))
+            return cursor.rowcount
+
+def create_session_store(backend, database, ttl=3600):
+    if backend == 'memory':
+        return MemorySessionStore(ttl)
+    if backend == 'sqlite':
+        return SQLiteSessionStore(database, ttl)
+    raise ValueError(f"Unknown session backend: {backend}")
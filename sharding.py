@@ -0,0 +1,72 @@
+import asyncio
+from contextlib import asynccontextmanager
+from telegram.ext import BaseUpdateProcessor
+
+class ChatUpdateProcessor(BaseUpdateProcessor):
+    # Handles up to max_concurrent_updates at once, but never two updates
+    # from the same chat: each chat's updates run one at a time in arrival
+    # order, so a user's registration steps cannot race each other.
+    # Different chats still run side by side.
+    #
+    # The ordering holds within one process only; there is no lock across
+    # processes. Several processes on one host can share DB_PATH, and two
+    # of them may handle updates from the same chat at the same time. A
+    # registration still can't lose a step: sessions are saved by
+    # compare-and-swap on their version (see sessions.py), so the step that
+    # loses the race is redone or turned away instead of overwriting the
+    # other. With SESSION_BACKEND=memory every process has sessions of its
+    # own, so run a single process.
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        self.chats = KeyedLocks()
+
+    async def process_update(self, update, coroutine):
+        # The chat lock is taken before a concurrency slot, so a burst from
+        # one chat waits in line without starving the others
+        async with self.chats.hold(chat_key(update)):
+            await super().process_update(update, coroutine)
+
+    async def do_process_update(self, update, coroutine):
+        await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+class KeyedLocks:
+    # One asyncio.Lock per key, created on first use and dropped once
+    # nothing holds or waits for it. A key of None isn't locked.
+    def __init__(self):
+        # key -> [lock, tasks holding or waiting for it]
+        self.entries = {}
+
+    @asynccontextmanager
+    async def hold(self, key):
+        if key is None:
+            yield
+            return
+
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = self.entries[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self.entries[key]
+
+def chat_key(update):
+    # Updates are keyed by chat, falling back to the user for updates
+    # without one (e.g. inline queries)
+    if not hasattr(update, 'effective_chat'):
+        return None
+    if update.effective_chat:
+        return update.effective_chat.id
+    if update.effective_user:
+        return update.effective_user.id
+    return None